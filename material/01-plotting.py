@@ -25,9 +25,9 @@ print(palette)
 # You can also use many color names, e.g., `'blue'`, `'red'`, `'yellow'`, `'firebrick'`, etc.  Feel free to explore.
 
 
-# We will use NumPy and SciPy to create some sample data.
+# We will use NumPy to create some sample data.
 import numpy as np
-import scipy.stats
+from pdf import gaussian_pdf
 
 '''
 ## Sample plot
@@ -40,11 +40,11 @@ $$f(x | \mu, \sigma^2) = \frac{1}{\sqrt{2\pi\sigma^2}} \,\exp\left({-\frac{(x-\m
 
 where $\mu$ is the mean value, and $\sigma$ is the standard deviation.
 
-SciPy provides [`scipy.stats.norm`](https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.norm.html) which include many functions related to the Gaussian distribution.  Here is a simple wrapper of the probability density function (pdf).
+SciPy provides [`scipy.stats.norm`](https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.norm.html) which include many functions related to the Gaussian distribution.  As we evaluate this formula over and over, we use `gaussian_pdf` from `pdf.py`, a direct NumPy implementation of the probability density function (pdf) that skips SciPy's generic argument handling.  Here is a simple wrapper of it.
 '''
 
 def gaussian(x_array, mu, sigma):
-    pdf = scipy.stats.norm.pdf(x_array, loc=mu, scale=sigma)
+    pdf = gaussian_pdf(x_array, mu, sigma)
     return pdf
 
 
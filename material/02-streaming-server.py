@@ -0,0 +1,158 @@
+'''
+Stream random points from one shared feed to every viewer.
+
+Use the ``bokeh serve`` command to run the example by executing:
+
+    bokeh serve --show 02-streaming-server.py
+
+at your command prompt. This will open the URL
+
+    http://localhost:5006/02-streaming-server
+
+in your browser.  Unlike the loop in 02-streaming.ipynb, the points are
+drawn by a single producer in the server process, and every open session
+receives the same batches.
+
+Another feed can be plugged in with ``--feed module:function``, where
+``function()`` returns an async iterator of batches like ``gaussian_feed``
+in streaming.py, i.e. dicts ``{0: {'x': x, 'y': y}, 1: {...}}`` of arrays
+for the two sources of the plot:
+
+    bokeh serve --show 02-streaming-server.py --args --feed my_feeds:sensor
+
+'''
+
+import argparse
+from functools import partial
+import importlib
+
+import numpy as np
+
+import bokeh.plotting
+import bokeh.layouts
+from bokeh.models import ColumnDataSource
+from bokeh.models.widgets import DataTable, Paragraph, TableColumn
+
+from bokeh.palettes import Category10_10 as palette
+
+from metrics import install, registry
+from shared_data import shared
+from stream_stats import StreamStats
+from streaming import StreamHub, gaussian_feed
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--feed', default=None,
+                    help='module:function returning an async iterator of '
+                         'batches (random Gaussian points by default)')
+parser.add_argument('--n-new', type=int, default=20,
+                    help='points per distribution in each batch')
+parser.add_argument('--interval', type=float, default=0.05,
+                    help='seconds between batches')
+parser.add_argument('--rollover', type=int, default=20000,
+                    help='most points kept in each source')
+parser.add_argument('--seed', type=int, default=0,
+                    help='random seed of the distributions and points')
+parser.add_argument('--halflife', type=float, default=None,
+                    help='points after which the weight of a point in the '
+                         'running statistics halves (default: never)')
+parser.add_argument('--full-precision', action='store_true',
+                    help='send float64 points rather than float32')
+args = parser.parse_args()
+
+# ~~~~~~~~~~~~~~ create the feed ~~~~~~~~~~~~~~ #
+def load_feed(spec):
+    module, name = spec.split(':')
+    return getattr(importlib.import_module(module), name)
+
+if args.feed:
+    feed = load_feed(args.feed)
+    stream_key = 'stream-' + args.feed
+else:
+    rng = np.random.default_rng(args.seed)
+    mu = rng.integers(-40, 40, (2, 2))
+    sigma = rng.integers(1, 25, (2, 2))
+    feed = partial(gaussian_feed, mu, sigma, args.n_new, args.interval,
+                   args.seed)
+    stream_key = 'stream-gaussian-{}-{}-{}'.format(args.n_new, args.interval,
+                                                   args.seed)
+
+# one producer per server process, shared by all sessions
+hub = shared(stream_key, lambda: StreamHub(feed))
+
+# ~~~~~~~~~~~~~~ setup the figure ~~~~~~~~~~~~~~ #
+my_fig = bokeh.plotting.figure(
+    plot_width=400,
+    plot_height=400,
+    x_axis_label='x',
+    y_axis_label='y',
+    x_range=(-100, 100),
+    y_range=(-100, 100),
+)
+
+data1 = ColumnDataSource(data=dict(x=[], y=[]))
+data2 = ColumnDataSource(data=dict(x=[], y=[]))
+
+my_fig.circle(
+    "x", "y",
+    source=data1,
+    color=palette[0],
+    alpha=0.2,
+)
+
+my_fig.circle(
+    "x", "y",
+    source=data2,
+    color=palette[1],
+    alpha=0.2,
+)
+
+# running estimates of the distributions, updated with every batch
+edges = np.linspace(-100, 100, 41)
+stats1 = StreamStats(['x', 'y'], edges, args.halflife)
+stats2 = StreamStats(['x', 'y'], edges, args.halflife)
+
+hist_fig = bokeh.plotting.figure(
+    plot_width=400,
+    plot_height=200,
+    x_axis_label='x',
+    x_range=my_fig.x_range,
+)
+for stats, color in ((stats1, palette[0]), (stats2, palette[1])):
+    hist_fig.quad(
+        left='left', right='right', top='count', bottom=0,
+        source=stats.histograms['x'],
+        color=color,
+        alpha=0.4,
+        line_color=None,
+    )
+
+tables = [
+    DataTable(
+        source=stats.summary,
+        columns=[TableColumn(field=field, title=field)
+                 for field in ('column', 'n', 'mean', 'std')],
+        width=400,
+        height=80,
+    )
+    for stats in (stats1, stats2)
+]
+
+status = Paragraph()
+
+# ~~~~~~~~~~~~~~ create the application ~~~~~~~~~~~~~~ #
+doc = bokeh.plotting.curdoc()
+install(doc)
+doc.add_root(bokeh.layouts.column(my_fig, hist_fig, *tables, status))
+doc.title = "Streaming"
+
+stream = hub.watch(doc, {0: data1, 1: data2}, rollover=args.rollover,
+                   compact=not args.full_precision)
+stream.streamer.on_stream(data1, stats1.update)
+stream.streamer.on_stream(data2, stats2.update)
+
+def show_status():
+    status.text = 'viewers: {}, dropped batches: {}, sent {:.0f} of {:.0f} kB'.format(
+        len(hub.sessions), stream.dropped,
+        registry.payload_sent_bytes / 1e3, registry.payload_raw_bytes / 1e3)
+
+doc.add_periodic_callback(show_status, 1000)
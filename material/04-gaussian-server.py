@@ -3,264 +3,574 @@ Present a scatter plot with linked histograms on both axes.
 
 Use the ``bokeh serve`` command to run the example by executing:
 
-    bokeh serve --show selection_histogram.py
+    bokeh serve --show 04-gaussian-server.py
 
 at your command prompt. This will open the URL
 
-    http://localhost:5006/selection_histogram
+    http://localhost:5006/04-gaussian-server
 
 in your browser.
 
+For large datasets, have the server shade the scatter plot with Datashader
+rather than sending every point to the browser:
+
+    bokeh serve --show 04-gaussian-server.py --args --render raster --scale 10000
+
+or send only a representative sample of the visible points, and all of
+them once few enough are in view:
+
+    bokeh serve --show 04-gaussian-server.py --args --render lod --scale 10000
+
 '''
 
+import argparse
+import os
+import time
+
 import numpy as np
-import scipy.stats
-import scipy.optimize
 
 import bokeh.plotting
 import bokeh.layouts
-from bokeh.models import BoxSelectTool, LassoSelectTool, Spacer
+from bokeh.events import SelectionGeometry
+from bokeh.models import BoxSelectTool, LassoSelectTool, Range1d, Spacer
 from bokeh.models.widgets import Slider, Paragraph
 
 from bokeh.palettes import Category10_10 as palette
 
-def gaussian(x_array, mu, sigma):
-    pdf = scipy.stats.norm.pdf(x_array, loc=mu, scale=sigma)
-    return pdf
+from callbacks import Offloaded, Throttled, on_ranges_change
+from dataset_cache import DatasetCache, get_default_cache
+from gaussian_data import cached_gaussian_points
+from gaussian_fit import fit_gaussian, gaussian_curve
+from histograms import CumulativeHistogram, update_column
+from memo import LRUCache, fingerprint
+from metrics import install, instrument, registry, start_http_server, stats_panel
+from selection import cached_grid_index
+from shared_data import shared
+from snapshot import stamp
+from transport import compact, compact_columns
+
+startup = time.perf_counter()
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--render', choices=['points', 'raster', 'lod'], default='points',
+                    help='send all the points to the browser, shade them on the '
+                         'server, or send a level-of-detail sample of them')
+parser.add_argument('--partitions', type=int, default=os.cpu_count(),
+                    help='partitions aggregated in parallel in raster mode '
+                         '(default: one per core)')
+parser.add_argument('--lod-points', type=int, default=20000,
+                    help='most points sent to the browser in lod mode')
+parser.add_argument('--scale', type=int, default=1,
+                    help='multiply the number of points by this factor')
+parser.add_argument('--seed', type=int, default=0,
+                    help='random seed used to generate the points')
+parser.add_argument('--data-dir', default=None,
+                    help='directory of the dataset cache shared by server processes')
+parser.add_argument('--live-rate', type=float, default=30,
+                    help='most histogram updates per second while a selection '
+                         'is being drawn (0 to only update when it is done)')
+parser.add_argument('--memo-mb', type=float, default=256,
+                    help='memory for the selections and fits remembered by '
+                         'each server process, in MB')
+parser.add_argument('--metrics-port', type=int, default=9100,
+                    help='port of the local metrics endpoint (0 to disable)')
+parser.add_argument('--stats', action='store_true',
+                    help='show the server metrics below the plots')
+args = parser.parse_args()
 
 # ~~~~~~~~~~~~~~ create dataset ~~~~~~~~~~~~~~ #
-# create three Gaussian distributions
-x1 = np.random.normal(loc=5.0, size=400) * 100
-y1 = np.random.normal(loc=10.0, size=400) * 10
-
-x2 = np.random.normal(loc=5.0, size=800) * 50
-y2 = np.random.normal(loc=5.0, size=800) * 10
-
-x3 = np.random.normal(loc=55.0, size=200) * 10
-y3 = np.random.normal(loc=4.0, size=200) * 10
-
-x = np.concatenate((x1, x2, x3))
-y = np.concatenate((y1, y2, y3))
+# three Gaussian distributions: (x, y) centers, spreads and point counts
+mu = [(500, 100), (250, 50), (550, 40)]
+sigma = [(100, 10), (50, 10), (10, 10)]
+n_points = [400 * args.scale, 800 * args.scale, 200 * args.scale]
+
+# the points are drawn once, kept on disk by their parameters and
+# memory-mapped, so restarts and all server processes share one copy; the
+# objects derived from them are built once per process for all sessions,
+# and cost each process 4 bytes per point for the histogram bins (uint16
+# per axis), plus 4 for the grid index order in lod mode
+dataset_key = 'gaussian-scale{}-seed{}'.format(args.scale, args.seed)
+cache = DatasetCache(args.data_dir) if args.data_dir else get_default_cache()
+points = shared(dataset_key, lambda: cached_gaussian_points(
+    mu, sigma, n_points, seed=args.seed, cache=cache))
+x, y = points[:, 0], points[:, 1]
 
 x_min = np.floor(x.min())
 x_max = np.ceil(x.max())
 y_min = np.floor(y.min())
 y_max = np.ceil(y.max())
 
+# selections and fits already computed, by a hash of their inputs, for
+# all the sessions: going back to an earlier view costs a lookup
+memo = shared(dataset_key + '-memo', lambda: LRUCache(
+    'memo', int(args.memo_mb * 2**20)))
+
+# ~~~~~~~~~~~~~ histogram state ~~~~~~~~~~~~~ #
+# the points are sorted into fine bins once, and the n_bins bins shown for
+# any range are added up from the cumulative counts of the fine bins; a
+# multiple of n_bins, so every range fits in whole, equal bins
+n_bins = 100
+fine_bins = 40 * n_bins
+x_hist = shared(dataset_key + '-xhist', lambda: CumulativeHistogram(x, bins=fine_bins))
+y_hist = shared(dataset_key + '-yhist', lambda: CumulativeHistogram(y, bins=fine_bins))
+hists = {'x': x_hist, 'y': y_hist}
+
+def bins_in(hist, low, high):
+    # layout, edges and counts of the bins shown for the range
+    layout = hist.layout(low, high, n_bins)
+    return layout, hist.edges[layout], hist.rebin(hist.cumulative, layout)
+
+# the counts are sent as int32, which Bokeh encodes in binary, unlike int64
+hlayout, hedges, hhist = bins_in(x_hist, x_min, x_max)
+hhist = compact(hhist)
+hzeros = np.zeros(len(hhist), dtype=np.int32)
+hmax = max(hhist)*1.1
+hfit_x = (hedges[:-1] + hedges[1:]) / 2  # bin centers
+
+vlayout, vedges, vhist = bins_in(y_hist, y_min, y_max)
+vhist = compact(vhist)
+vzeros = np.zeros(len(vhist), dtype=np.int32)
+vmax = max(vhist)*1.1
+vfit_y = (vedges[:-1] + vedges[1:]) / 2  # bin centers
+
 # ~~~~~~~~~~~~~ setup the figures ~~~~~~~~~~~~~ #
 TOOLS="pan,wheel_zoom,box_select,lasso_select,reset"
 
-# create the scatter plot
-p = bokeh.plotting.figure(
-    tools=TOOLS,
-    plot_width=600, plot_height=600,
-    toolbar_location="above",
-    title="Fit Gaussians",
-)
-p.select(LassoSelectTool).select_every_mousemove = False  # wait to update until mouse released
-
-r = p.circle(
-    x, y,
-    size=3,
-    alpha=0.6,
-    color=palette[1],
-)
+# the initial layout is the same for every session, so it is built once per
+# process and each session starts from a copy of it (see snapshot.py); the
+# models are found again by name
+def build(doc):
+    # create the scatter plot
+    if args.render == 'points':
+        p = bokeh.plotting.figure(
+            tools=TOOLS,
+            plot_width=600, plot_height=600,
+            toolbar_location="above",
+            title="Fit Gaussians",
+            name="scatter",
+        )
+    else:
+        # the points are re-rendered as the ranges change, so they cannot auto-range
+        p = bokeh.plotting.figure(
+            tools=TOOLS,
+            plot_width=600, plot_height=600,
+            toolbar_location="above",
+            title="Fit Gaussians",
+            x_range=Range1d(x_min, x_max),
+            y_range=Range1d(y_min, y_max),
+            name="scatter",
+        )
+    # with live selection, the selection is sent while the mouse moves;
+    # otherwise wait to update until the mouse is released
+    for tool in list(p.select(BoxSelectTool)) + list(p.select(LassoSelectTool)):
+        tool.select_every_mousemove = bool(args.live_rate)
+
+    if args.render == 'points':
+        # sent as float32, half the bytes of the cached float64 points
+        p.circle(
+            compact(x), compact(y),
+            size=3,
+            alpha=0.6,
+            color=palette[1],
+            name="points",
+        )
+
+    # setup the horizontal histogram
+    ph = bokeh.plotting.figure(
+        toolbar_location=None,
+        plot_height=200,
+        plot_width=p.plot_width,
+        x_range=p.x_range,
+        y_range=(-hmax, hmax),
+        y_axis_location="right",
+        name="x_hist_plot",
+    )
 
-n_bins = 100
+    # horizontal histogram
+    ph.quad(
+        top=hhist,
+        bottom=0,
+        left=hedges[:-1],
+        right=hedges[1:],
+        alpha=0.2,
+        line_color=None,
+        color=palette[0],
+        name="hh0",
+    )
+    ph.quad(
+        top=hzeros.copy(),
+        bottom=0,
+        left=hedges[:-1],
+        right=hedges[1:],
+        alpha=0.9,
+        line_color=None,
+        color=palette[1],
+        name="hh1",
+    )
+    ph.quad(
+        top=hzeros.copy(),
+        bottom=0,
+        left=hedges[:-1],
+        right=hedges[1:],
+        alpha=0.2,
+        line_color=None,
+        color=palette[0],
+        name="hh2",
+    )
+    # Gaussian fit of histogram
+    hfit_y = gaussian_curve(hfit_x, *fit_gaussian(hfit_x, hhist))
+    ph.line(hfit_x, hfit_y, color=palette[2], name="x_fit_line")
+    ph.line([hfit_x[0], hfit_x[0]], [0, hmax], color=palette[3], name="x_min_line")
+    ph.line([hfit_x[-1], hfit_x[-1]], [0, hmax], color=palette[4], name="x_max_line")
+
+    # setup the vertical histogram
+    pv = bokeh.plotting.figure(
+        toolbar_location=None,
+        plot_width=200,
+        plot_height=p.plot_height,
+        y_range=p.y_range,
+        x_range=(-vmax, vmax),
+        y_axis_location="right",
+        name="y_hist_plot",
+    )
 
-# setup the horizontal histogram
-hhist, hedges = np.histogram(x, bins=n_bins)
-hzeros = np.zeros(n_bins)
-hmax = max(hhist)*1.1
+    # vertical histogram
+    pv.quad(
+        top=vedges[1:],
+        bottom=vedges[:-1],
+        left=0,
+        right=vhist,
+        alpha=0.2,
+        line_color=None,
+        color=palette[0],
+        name="vh0",
+    )
+    pv.quad(
+        top=vedges[1:],
+        bottom=vedges[:-1],
+        left=0,
+        right=vzeros.copy(),
+        alpha=0.9,
+        line_color=None,
+        color=palette[1],
+        name="vh1",
+    )
+    pv.quad(
+        top=vedges[1:],
+        bottom=vedges[:-1],
+        left=0,
+        right=vzeros.copy(),
+        alpha=0.2,
+        line_color=None,
+        color=palette[0],
+        name="vh2",
+    )
+    vfit_x = gaussian_curve(vfit_y, *fit_gaussian(vfit_y, vhist))
+    pv.line(vfit_x, vfit_y, color=palette[2], name="v_fit_line")
+    pv.line([0, vmax], [vfit_y[0], vfit_y[0]], color=palette[3], name="v_min_line")
+    pv.line([0, vmax], [vfit_y[-1], vfit_y[-1]], color=palette[4], name="v_max_line")
+
+    # ~~~~~~~~~~~~~~ create the sliders ~~~~~~~~~~~~~~ #
+    x_low = Slider(title="x-min", value=x_min, start=x_min, end=x_max, step=1.0, name="x_low")
+    x_high = Slider(title="x-max", value=x_max, start=x_min, end=x_max, step=1.0, name="x_high")
+    x_output = Paragraph(name="x_output")
+
+    y_low = Slider(title="y-min", value=y_min, start=y_min, end=y_max, step=1.0, name="y_low")
+    y_high = Slider(title="y-max", value=y_max, start=y_min, end=y_max, step=1.0, name="y_high")
+    y_output = Paragraph(name="y_output")
+
+    # ~~~~~~~~~~~~~~ arrange the interface ~~~~~~~~~~~~~~ #
+    layout = bokeh.layouts.column(
+        bokeh.layouts.row(p, pv, bokeh.layouts.widgetbox(y_low, y_high, y_output)),
+        bokeh.layouts.row(ph, Spacer(width=200, height=200)),
+        bokeh.layouts.widgetbox(x_low, x_high, x_output),
+        name="layout",
+    )
+    doc.add_root(layout)
+    doc.title = "Fit Gaussians"
 
-ph = bokeh.plotting.figure(
-    toolbar_location=None,
-    plot_height=200,
-    plot_width=p.plot_width,
-    x_range=p.x_range,
-    y_range=(-hmax, hmax),
-    y_axis_location="right",
-)
-
-# horizontal histogram
-ph.quad(
-    top=hhist,
-    bottom=0,
-    left=hedges[:-1],
-    right=hedges[1:],
-    alpha=0.2,
-    line_color=None,
-    color=palette[0],
-)
-hh1 = ph.quad(
-    top=hzeros,
-    bottom=0,
-    left=hedges[:-1],
-    right=hedges[1:],
-    alpha=0.9,
-    line_color=None,
-    color=palette[1],
-)
-hh2 = ph.quad(
-    top=hzeros,
-    bottom=0,
-    left=hedges[:-1],
-    right=hedges[1:],
-    alpha=0.2,
-    line_color=None,
-    color=palette[0],
-)
-# Gaussian fit of histogram
-hfit_x = hedges[:-1]
-hfit_x += hfit_x[1] - hfit_x[0]
-mu0 = hfit_x.mean()
-sigma0 = (hfit_x.max() - hfit_x.min()) / 4
-hfit_y = gaussian(hfit_x, mu0, sigma0)
-x_fit_line = ph.line(hfit_x, hfit_y, color=palette[2])
-x_min_line = ph.line([hfit_x[0], hfit_x[0]], [0, hmax], color=palette[3])
-x_max_line = ph.line([hfit_x[-1], hfit_x[-1]], [0, hmax], color=palette[4])
-
-# setup the vertical histogram
-vhist, vedges = np.histogram(y, bins=n_bins)
-vzeros = np.zeros(n_bins)
-vmax = max(vhist)*1.1
+# ~~~~~~~~~~~~~~ create the application ~~~~~~~~~~~~~~ #
+doc = bokeh.plotting.curdoc()
+stamp(doc, '{}-doc-{}-live{}'.format(dataset_key, args.render, bool(args.live_rate)),
+      build)
+
+def model(name):
+    return doc.select_one({'name': name})
+
+p = model("scatter")
+ph, pv = model("x_hist_plot"), model("y_hist_plot")
+hh0, hh1, hh2 = model("hh0"), model("hh1"), model("hh2")
+vh0, vh1, vh2 = model("vh0"), model("vh1"), model("vh2")
+x_fit_line, x_min_line, x_max_line = model("x_fit_line"), model("x_min_line"), model("x_max_line")
+v_fit_line, v_min_line, v_max_line = model("v_fit_line"), model("v_min_line"), model("v_max_line")
+x_low, x_high, x_output = model("x_low"), model("x_high"), model("x_output")
+y_low, y_high, y_output = model("y_low"), model("y_high"), model("y_output")
+
+# the scatter plot contents depending on the view are per session
+if args.render == 'points':
+    r = model("points")
+elif args.render == 'raster':
+    import pandas as pd
+    from raster import ScatterRaster
+    # a view of the memory-mapped points, not a copy of them
+    frame = shared(dataset_key + '-frame', lambda: pd.DataFrame(
+        points, columns=['x', 'y'], copy=False))
+    raster = ScatterRaster(frame, p, doc, npartitions=args.partitions)
+else:
+    from pyramid import PointPyramid, ScatterLOD
+    pyramid = shared(dataset_key + '-pyramid', lambda: PointPyramid(x, y))
+    lod = ScatterLOD(
+        pyramid, p, doc,
+        max_points=args.lod_points,
+        size=3,
+        alpha=0.6,
+        color=palette[1],
+    )
 
-pv = bokeh.plotting.figure(
-    toolbar_location=None,
-    plot_width=200,
-    plot_height=p.plot_height,
-    y_range=p.y_range,
-    x_range=(-vmax, vmax),
-    y_axis_location="right"
-)
-
-# vertical histogram
-pv.quad(
-    top=vedges[1:],
-    bottom=vedges[:-1],
-    left=0,
-    right=vhist,
-    alpha=0.2,
-    line_color=None,
-    color=palette[0],
-)
-vh1 = pv.quad(
-    top=vedges[1:],
-    bottom=vedges[:-1],
-    left=0,
-    right=vzeros,
-    alpha=0.9,
-    line_color=None,
-    color=palette[1],
-)
-vh2 = pv.quad(
-    top=vedges[1:],
-    bottom=vedges[:-1],
-    left=0,
-    right=vzeros,
-    alpha=0.2,
-    line_color=None,
-    color=palette[0],
-)
-vfit_y = vedges[:-1]
-vfit_y += vfit_y[1] - vfit_y[0]
-mu0 = vfit_y.mean()
-sigma0 = (vfit_y.max() - vfit_y.min()) / 4
-vfit_x = gaussian(vfit_y, mu0, sigma0)
-v_fit_line = pv.line(vfit_x, vfit_y, color=palette[2])
-v_min_line = pv.line([0, vmax], [vfit_y[0], vfit_y[0]], color=palette[3])
-v_max_line = pv.line([0, vmax], [vfit_y[-1], vfit_y[-1]], color=palette[4])
-
-
-# ~~~~~~~~~~~~~~ create the sliders ~~~~~~~~~~~~~~ #
-x_low = Slider(title="x-min", value=x_min, start=300, end=x_min)  # , step=1.0)
-x_high = Slider(title="x-max", value=x_max, start=x_min, end=x_min)  # , step=1.0)
-x_output = Paragraph()
-
-y_low = Slider(title="y-min", value=y_min, start=y_min, end=y_min)  # , step=1.0)
-y_high = Slider(title="y-max", value=y_max, start=y_min, end=y_min)  # , step=1.0)
-y_output = Paragraph()
-
-# ~~~~~~~~~~~~~~ arrange the interface ~~~~~~~~~~~~~~ #
-layout = bokeh.layouts.column(
-    bokeh.layouts.row(p, pv, bokeh.layouts.widgetbox(y_low, y_high)),
-    bokeh.layouts.row(ph, Spacer(width=200, height=200)),
-    bokeh.layouts.widgetbox(x_low, x_high),
-)
+# server-side selections are resolved with a grid index over the points
+if args.render == 'raster':
+    # its point order is memory-mapped from the dataset cache, like the points
+    index = shared(dataset_key + '-index', lambda: cached_grid_index(
+        x, y, dict(mu=mu, sigma=sigma, n_points=n_points, seed=args.seed),
+        cache))
+elif args.render == 'lod':
+    index = pyramid.grid
+
+# the bins shown on each axis, and the cumulative fine counts of the
+# selected points (None when nothing is selected)
+layouts = {'x': hlayout, 'y': vlayout}
+selected = {'x': None, 'y': None}
+
+install(doc)
+if args.metrics_port:
+    start_http_server(args.metrics_port)
+if args.stats:
+    model("layout").children.append(stats_panel(doc))
 
 # ~~~~~~~~~~ define a fitting function ~~~~~~~~ #
-def do_fit(fit_data):
-    mu_guess = fit_data.mean()
-    sigma_guess = (fit_data.max() - fit_data.min()) / 4
-    guess = [mu_guess, sigma_guess]
-
-    (mu, sigma), _ = scipy.optimize.curve_fit(
-        gaussian,
-        p0=guess,
-        bounds=([x_min, 0], [x_max, np.inf]),
-    )
-    return mu, sigma
+def do_fit(hist, layout, selection, low, high):
+    # fit the selected points in the shown bins, or all of them if none are
+    edges = hist.edges[layout]
+    centers = (edges[:-1] + edges[1:]) / 2
+    counts = hist.rebin(hist.cumulative if selection is None else selection,
+                        layout)
+    if not np.any(counts):
+        counts = hist.rebin(hist.cumulative, layout)
+    mu, sigma, scale = fit_gaussian(centers, counts, low, high)
+    return centers, mu, sigma, gaussian_curve(centers, mu, sigma, scale)
+
+# the fits run in a worker thread, with the inputs gathered beforehand
+def x_fit_inputs(attr, old, new):
+    return layouts['x'], selected['x'], x_low.value, x_high.value
+
+def compute_x_fit(layout, selection, low, high):
+    return memo.get(
+        ('x_fit', fingerprint(layout, selection, low, high)),
+        lambda: (low, high) + do_fit(x_hist, layout, selection, low, high))
+
+def show_x_fit(fit):
+    low, high, centers, mu, sigma, fit_y = fit
 
-def update_x_fit(attr, old, new):
     # fit_pdf limits lines
-    x_min_line.data_source.data['x'] = [x_low.value] * 2
-    x_max_line.data_source.data['x'] = [x_high.value] * 2
+    x_min_line.data_source.data['x'] = [low] * 2
+    x_max_line.data_source.data['x'] = [high] * 2
 
-    # fit the data within input bounds
-    data = hh1.data_source.data["top"]
-    mask = (hfit_x > x_min) & (hfit_x < x_max)
-    fit_data = data[mask]
-    mu, sigma = do_fit(fit_data)
+    if not np.isfinite([mu, sigma]).all():
+        x_output.text = 'not enough data to fit'
+        return
 
     # output the fit results
     x_output.text = 'mu: {:0.1f}, sigma: {:0.1f}'.format(mu, sigma)
 
     # fit_pdf guassian fit
-    hfit_y = gaussian(fit_data, mu, sigma)
-    x_fit_line.data_source.data['y'] = hfit_y
+    x_fit_line.data_source.data = dict(x=centers, y=fit_y)
+
+def y_fit_inputs(attr, old, new):
+    return layouts['y'], selected['y'], y_low.value, y_high.value
+
+def compute_y_fit(layout, selection, low, high):
+    return memo.get(
+        ('y_fit', fingerprint(layout, selection, low, high)),
+        lambda: (low, high) + do_fit(y_hist, layout, selection, low, high))
+
+def show_y_fit(fit):
+    low, high, centers, mu, sigma, fit_x = fit
 
-def update_y_fit(attr, old, new):
     # fit_pdf limits lines
-    y_min_line.data_source.data['y'] = [y_low.value] * 2
-    y_max_line.data_source.data['y'] = [y_high.value] * 2
+    v_min_line.data_source.data['y'] = [low] * 2
+    v_max_line.data_source.data['y'] = [high] * 2
 
-    # fit the data within input bounds
-    data = vh1.data_source.data["right"]
-    print(len(vfit_y))
-    mask = (vfit_y > y_min) & (vfit_y < y_max)
-    fit_data = data[mask]
-    mu, sigma = do_fit(fit_data)
+    if not np.isfinite([mu, sigma]).all():
+        y_output.text = 'not enough data to fit'
+        return
 
     # output the fit results
     y_output.text = 'mu: {:0.1f}, sigma: {:0.1f}'.format(mu, sigma)
 
     # fit_pdf guassian fit
-    vfit_x = gaussian(fit_data, mu, sigma)
-    y_fit_line.data_source.data['x'] = vfit_x
-
-# ~~~~~~~~~~~~~~ create the application ~~~~~~~~~~~~~~ #
-bokeh.plotting.curdoc().add_root(layout)
-bokeh.plotting.curdoc().title = "Fit Gaussians"
+    v_fit_line.data_source.data = dict(x=fit_x, y=centers)
 
 # ~~~~~~~~~~~~~~ define how application updates ~~~~~~~~~~~~~~ #
-def update(attr, old, new):
-    inds = np.array(new['1d']['indices'])
+def bin_selection(inds):
     if len(inds) == 0 or len(inds) == len(x):
-        hhist1, hhist2 = hzeros, hzeros
-        vhist1, vhist2 = vzeros, vzeros
+        return None, None
+    # only the selected points are binned, into the fine bins
+    return x_hist.selected_cumulative(inds), y_hist.selected_cumulative(inds)
+
+def compute_histograms(inds, final):
+    # selections still being drawn are not worth remembering
+    if not final:
+        return bin_selection(inds)
+    return memo.get(('histograms', fingerprint(inds)),
+                    lambda: bin_selection(inds))
+
+# the total, selected and unselected quads of each axis, the columns of
+# their bin edges and counts, and the range of the counts
+quads = {
+    'x': ((hh0, hh1, hh2), ('left', 'right', 'top'), ph.y_range),
+    'y': ((vh0, vh1, vh2), ('bottom', 'top', 'right'), pv.x_range),
+}
+
+def show_bins(axis, relayout=False):
+    hist, layout, selection = hists[axis], layouts[axis], selected[axis]
+    total = hist.rebin(hist.cumulative, layout)
+    if selection is None:
+        counts = total, np.zeros(len(total), int), np.zeros(len(total), int)
+    else:
+        # the unselected counts are the total minus the selected counts
+        in_selection = hist.rebin(selection, layout)
+        counts = total, in_selection, -(total - in_selection)
+    # at most the number of points, so they always fit int32
+    counts = [compact(values) for values in counts]
+
+    renderers, (low, high, count), count_range = quads[axis]
+    if relayout:
+        edges = hist.edges[layout]
+        # the edges are sent as float32 and the counts as int32
+        for renderer, values in zip(renderers, counts):
+            renderer.data_source.data = compact_columns(
+                {low: edges[:-1], high: edges[1:], count: values})
+        peak = max(total.max(), 1) * 1.1
+        count_range.start, count_range.end = -peak, peak
     else:
-        neg_inds = np.ones_like(x, dtype=np.bool)
-        neg_inds[inds] = False
-        hhist1, _ = np.histogram(x[inds], bins=hedges)
-        vhist1, _ = np.histogram(y[inds], bins=vedges)
-        hhist2, _ = np.histogram(x[neg_inds], bins=hedges)
-        vhist2, _ = np.histogram(y[neg_inds], bins=vedges)
-
-    hh1.data_source.data["top"]   =  hhist1
-    hh2.data_source.data["top"]   = -hhist2
-    vh1.data_source.data["right"] =  vhist1
-    vh2.data_source.data["right"] = -vhist2
-
-r.data_source.on_change('selected', update)
+        # send only the changed bins
+        for renderer, values in zip(renderers[1:], counts[1:]):
+            update_column(renderer.data_source, count, values)
+
+def show_histograms(selections):
+    selected['x'], selected['y'] = selections
+    # all the updates are held together
+    doc.hold('combine')
+    try:
+        show_bins('x')
+        show_bins('y')
+    finally:
+        doc.unhold()
+
+    # refit the new selection
+    update_x_fit(None, None, None)
+    update_y_fit(None, None, None)
+
+def show_visible_bins():
+    # rebin the histograms to the visible part of the scatter plot, from
+    # the cumulative counts, so this is cheap enough for the event loop
+    changed = []
+    for axis, plot_range in (('x', p.x_range), ('y', p.y_range)):
+        if plot_range.start is None or plot_range.end is None:
+            continue
+        layout = hists[axis].layout(plot_range.start, plot_range.end, n_bins)
+        if not np.array_equal(layout, layouts[axis]):
+            layouts[axis] = layout
+            changed.append(axis)
+
+    doc.hold('combine')
+    try:
+        for axis in changed:
+            show_bins(axis, relayout=True)
+    finally:
+        doc.unhold()
+
+    if 'x' in changed:
+        update_x_fit(None, None, None)
+    if 'y' in changed:
+        update_y_fit(None, None, None)
+
+def selected_inds(attr, old, new, final=not args.live_rate):
+    # with live selection, the changes are only final once the gesture ends
+    return np.array(new['1d']['indices'], dtype=int), final
+
+def compute_geometry_selection(geometry, final):
+    # resolve the selection against the server-side arrays
+    def select():
+        inds = index.select(geometry)
+        return inds, bin_selection(inds)
+
+    # selections still being drawn are not worth remembering
+    if not final:
+        return select()
+
+    # the same box or lasso, in data coordinates, selects the same points
+    if geometry['type'] == 'rect':
+        shape = [geometry[k] for k in ('x0', 'x1', 'y0', 'y1')]
+    else:
+        shape = [geometry['x'], geometry['y']]
+    return memo.get(('geometry', fingerprint(geometry['type'], shape)), select)
+
+def show_geometry_selection(selection):
+    inds, selections = selection
+    if args.render == 'raster':
+        raster.select(inds)
+    show_histograms(selections)
+
+# slow work runs off the event loop; bursts of events are coalesced
+# (both steps are timed for the metrics)
+def offloaded(name, compute, apply, prepare=None, **kwargs):
+    return Offloaded(doc, instrument(name + '.compute', compute),
+                     instrument(name + '.apply', apply), prepare, **kwargs)
+
+update_x_fit = offloaded('x_fit', compute_x_fit, show_x_fit, x_fit_inputs)
+update_y_fit = offloaded('y_fit', compute_y_fit, show_y_fit, y_fit_inputs)
+# a live selection shows every result, even one already superseded, so
+# slow selections still update while they are drawn
+update = offloaded('selection', compute_histograms, show_histograms,
+                   selected_inds, apply_superseded=bool(args.live_rate))
+update_geometry = offloaded('geometry_selection', compute_geometry_selection,
+                            show_geometry_selection,
+                            apply_superseded=bool(args.live_rate))
+
+# while a selection is drawn, the histograms follow it at a capped rate,
+# skipping to the newest geometry; the final one is always shown
+if args.live_rate:
+    live_update = Throttled(doc, update, args.live_rate)
+    live_geometry = Throttled(doc, update_geometry, args.live_rate)
+else:
+    live_update = update
+
+def on_geometry(event):
+    if event.final:
+        if args.live_rate:
+            live_geometry.flush(event.geometry, True)
+        else:
+            update_geometry(event.geometry, True)
+    elif args.live_rate:
+        live_geometry(event.geometry, False)
+
+def on_points_geometry(event):
+    # the selection of the last mouse move, sent just before this event, is
+    # shown again as the final one
+    if event.final:
+        live_update.flush('selected', None, r.data_source.selected, True)
+
+if args.render == 'points':
+    r.data_source.on_change('selected', live_update)
+    if args.live_rate:
+        p.on_event(SelectionGeometry, on_points_geometry)
+else:
+    p.on_event(SelectionGeometry, on_geometry)
 x_low.on_change('value', update_x_fit)
 x_high.on_change('value', update_x_fit)
+y_low.on_change('value', update_y_fit)
+y_high.on_change('value', update_y_fit)
+on_ranges_change(p, doc, instrument('rebin', show_visible_bins))
+
+registry.observe_latency('session_startup', time.perf_counter() - startup)
@@ -0,0 +1,192 @@
+'''
+Render many static plots to standalone HTML files, in parallel.
+
+01-plotting builds one figure at a time and writes it with ``output_html``,
+which inlines or links BokehJS in every file.  For a report of many plots,
+``export`` takes a list of plot specs and renders them in a pool of
+processes, each writing its files as soon as they are done:
+
+    specs = [dict(name='gaussian-{}'.format(i), x=x, ys=[y1, y2],
+                  glyph='line', legend=['m=10, s=4', 'm=15, s=1'])
+             for i, (y1, y2) in enumerate(curves)]
+    paths = export(specs, 'report', processes=8)
+
+A spec is a dict of
+
+  - ``name``: the file name, without ``.html``
+  - ``x`` and ``ys``: the x values and a list of y arrays, one per series
+  - ``glyph``: the figure method drawing each series, e.g. ``'line'`` or
+    ``'circle'`` (default ``'line'``)
+  - ``palette``: colors of the series, in order (default Category10_10)
+  - ``legend``: labels of the series, or None for no legend
+  - ``title``, ``figure`` and ``glyph_args``: the plot title, and keyword
+    arguments for ``bokeh.plotting.figure`` and for the glyph method
+
+BokehJS is copied once to ``<directory>/static``, and every file loads it
+from there with a relative link, so each file only holds its own plot.
+
+Run this module to time a report of Gaussian curves like those of
+01-plotting:
+
+    python batch_export.py --count 2000 --directory report
+
+'''
+
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import os
+import shutil
+import time
+
+import numpy as np
+
+import bokeh.plotting
+from bokeh.embed import components
+from bokeh.palettes import Category10_10
+from bokeh.resources import Resources
+
+from pdf import gaussian_pdf
+
+STATIC = 'static'
+
+PAGE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+{head}
+{script}
+</head>
+<body>
+{div}
+</body>
+</html>
+'''
+
+
+def copy_resources(directory):
+    '''
+    Copy the BokehJS files to ``directory/static``, unless they are there
+    already, and return the ``<head>`` tags that load them from a file in
+    ``directory``.
+    '''
+    static = os.path.join(directory, STATIC)
+    os.makedirs(static, exist_ok=True)
+    resources = Resources(mode='absolute')
+
+    tags = []
+    for paths, tag in ((resources.css_files,
+                        '<link rel="stylesheet" href="{}" type="text/css">'),
+                       (resources.js_files,
+                        '<script type="text/javascript" src="{}"></script>')):
+        for path in paths:
+            name = os.path.basename(path)
+            target = os.path.join(static, name)
+            if (not os.path.exists(target)
+                    or os.path.getsize(target) != os.path.getsize(path)):
+                shutil.copyfile(path, target)
+            tags.append(tag.format(STATIC + '/' + name))
+    return '\n'.join(tags)
+
+
+def build_figure(spec):
+    '''The figure described by the plot ``spec`` (see the module docstring).'''
+    fig = bokeh.plotting.figure(title=spec.get('title'),
+                                **spec.get('figure', {}))
+    draw = getattr(fig, spec.get('glyph', 'line'))
+    palette = spec.get('palette', Category10_10)
+    legend = spec.get('legend')
+
+    for i, y in enumerate(spec['ys']):
+        kwargs = dict(color=palette[i % len(palette)])
+        if legend is not None:
+            kwargs['legend'] = legend[i]
+        kwargs.update(spec.get('glyph_args', {}))
+        draw(spec['x'], y, **kwargs)
+    return fig
+
+
+def render(spec, directory, head):
+    '''Write the plot ``spec`` to ``directory/<name>.html``; return the path.'''
+    script, div = components(build_figure(spec))
+    path = os.path.join(directory, spec['name'] + '.html')
+    with open(path, 'w') as f:
+        f.write(PAGE.format(title=spec.get('title') or spec['name'],
+                            head=head, script=script, div=div))
+    return path
+
+
+def iter_export(specs, directory, processes=None, pending=None):
+    '''
+    Render the ``specs`` in ``processes`` worker processes (the number of
+    CPUs by default), and yield the path of each file once it is written,
+    in the order they finish.  At most ``pending`` specs (four per process
+    by default) are sent to the workers ahead, so ``specs`` can be a
+    generator of more plots than fit in memory.
+    '''
+    head = copy_resources(directory)
+    processes = processes or os.cpu_count()
+    pending = pending or 4 * processes
+    specs = iter(specs)
+
+    with ProcessPoolExecutor(processes) as pool:
+        running = set()
+        for spec in specs:
+            running.add(pool.submit(render, spec, directory, head))
+            if len(running) >= pending:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in running:
+            yield future.result()
+
+
+def export(specs, directory, processes=None):
+    '''The paths of all the ``specs`` rendered by ``iter_export``.'''
+    return list(iter_export(specs, directory, processes))
+
+
+# ~~~~~~~~~~~~~~ example report ~~~~~~~~~~~~~~ #
+def gaussian_specs(count, n_points=100, seed=0):
+    '''``count`` plots of three random Gaussian curves each, as 01-plotting.'''
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 20, n_points)
+    for i in range(count):
+        mu = rng.uniform(5, 15, 3)
+        sigma = rng.uniform(1, 4, 3)
+        yield dict(
+            name='gaussian-{:05d}'.format(i),
+            title='Gaussian curves {}'.format(i),
+            x=x,
+            ys=[gaussian_pdf(x, m, s) for m, s in zip(mu, sigma)],
+            glyph='line',
+            legend=['m={:.1f}, s={:.1f}'.format(m, s)
+                    for m, s in zip(mu, sigma)],
+            figure=dict(x_axis_label='x', y_axis_label='f(x)',
+                        width=700, height=350),
+            glyph_args=dict(line_width=2),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--count', type=int, default=1000,
+                        help='number of plots')
+    parser.add_argument('--directory', default='report',
+                        help='where the HTML files are written')
+    parser.add_argument('--processes', type=int, nargs='+', default=[None],
+                        help='worker processes (default: the number of '
+                             'CPUs); several values are timed in turn')
+    args = parser.parse_args()
+
+    for processes in args.processes:
+        start = time.perf_counter()
+        n = sum(1 for _ in iter_export(gaussian_specs(args.count),
+                                       args.directory, processes))
+        elapsed = time.perf_counter() - start
+        print('{} plots with {} processes in {:.1f} s ({:.0f} plots/s)'.format(
+            n, processes or os.cpu_count(), elapsed, n / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+'''
+Benchmark the data generation, histogram, fitting, shading and streaming
+code.
+
+Run from this directory with
+
+    python benchmark.py
+    python benchmark.py --sizes 100000 10000000 --bins 100 1000 --only histogram
+
+Every benchmark is run for each dataset size (and bin count, where it
+applies) and reports its best time, throughput and peak memory.  Streaming
+is measured against a headless ``bokeh.document.Document``; no browser is
+needed.
+
+Results are appended to ``benchmark_results.jsonl`` along with the git
+revision, and each is compared with the latest result recorded for another
+revision, so regressions show up between commits.  The "vs prev" column is
+the previous time divided by the new one: values below 1 are slowdowns.
+
+'''
+
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import scipy.stats
+
+from bokeh.document import Document
+from bokeh.models import ColumnDataSource
+
+from gaussian_data import gaussian_points
+from gaussian_fit import fit_gaussian
+from histograms import CumulativeHistogram, SelectionHistogram
+from pdf import gaussian_pdf
+from streaming import BatchedStreamer
+
+here = os.path.dirname(os.path.abspath(__file__))
+default_results = os.path.join(here, 'benchmark_results.jsonl')
+
+benchmarks = []
+
+
+def benchmark(group, uses_bins=False):
+    '''
+    Register ``setup(n_points, n_bins) -> (run, n_items)``, where ``run()``
+    is the code to time and ``n_items`` what it processes per call.
+    '''
+    def register(setup):
+        benchmarks.append((group, setup.__name__, uses_bins, setup))
+        return setup
+    return register
+
+
+def measure(run, repeat):
+    '''Best wall time of ``repeat`` calls, and the peak memory of one.'''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+
+# ~~~~~~~~~~~~~~ data ~~~~~~~~~~~~~~ #
+MU = np.array([[2, 2], [2, -2], [-2, -2], [-2, 2], [0, 0]])
+SIGMA = np.array([0.05, 0.1, 0.5, 1.0, 5.0])
+
+
+def make_xy(n_points):
+    points = gaussian_points(MU, SIGMA, n_points // len(SIGMA), seed=0)
+    return points[:, 0].copy(), points[:, 1].copy()
+
+
+def scipy_gaussian(x_array, mu, sigma):
+    # the gaussian() wrapper as 01-plotting.py first wrote it
+    return scipy.stats.norm.pdf(x_array, loc=mu, scale=sigma)
+
+
+# ~~~~~~~~~~~~~~ generation ~~~~~~~~~~~~~~ #
+@benchmark('generate')
+def gaussian_points_float64(n_points, n_bins):
+    n_each = n_points // len(SIGMA)
+    return lambda: gaussian_points(MU, SIGMA, n_each), n_points
+
+
+@benchmark('generate')
+def gaussian_points_float32(n_points, n_bins):
+    n_each = n_points // len(SIGMA)
+    return lambda: gaussian_points(MU, SIGMA, n_each, np.float32), n_points
+
+
+@benchmark('pdf')
+def scipy_norm_pdf(n_points, n_bins):
+    x = np.linspace(-10, 10, n_points)
+    return lambda: scipy_gaussian(x, 1.0, 2.0), n_points
+
+
+@benchmark('pdf')
+def gaussian_pdf_kernel(n_points, n_bins):
+    x = np.linspace(-10, 10, n_points)
+    out = np.empty_like(x)
+    return lambda: gaussian_pdf(x, 1.0, 2.0, out=out), n_points
+
+
+@benchmark('pdf')
+def gaussian_pdf_kernel_float32(n_points, n_bins):
+    x = np.linspace(-10, 10, n_points, dtype=np.float32)
+    out = np.empty_like(x)
+    return lambda: gaussian_pdf(x, 1.0, 2.0, out=out), n_points
+
+
+@benchmark('pdf')
+def gaussian_pdf_kernel_batched(n_points, n_bins):
+    # 100 (mu, sigma) pairs against a grid of n_points / 100
+    x = np.linspace(-10, 10, max(n_points // 100, 1))
+    mu = np.linspace(-5, 5, 100)
+    sigma = np.linspace(0.5, 3, 100)
+    out = np.empty((100, len(x)))
+    return lambda: gaussian_pdf(x, mu, sigma, out=out), out.size
+
+
+# ~~~~~~~~~~~~~~ selection histograms ~~~~~~~~~~~~~~ #
+FINE_BINS = 40  # fine bins per shown bin, as in 04-gaussian-server.py
+
+
+def histogram_setup(n_points, n_bins, fraction):
+    x, y = make_xy(n_points)
+    rng = np.random.default_rng(0)
+    inds = np.sort(rng.choice(n_points, int(n_points * fraction), replace=False))
+    return x, y, inds
+
+
+def np_histogram_update(x, y, inds, hedges, vedges):
+    # the selection histograms as update() computed them originally
+    neg_inds = np.ones_like(x, dtype=bool)
+    neg_inds[inds] = False
+    np.histogram(x[inds], bins=hedges)
+    np.histogram(y[inds], bins=vedges)
+    np.histogram(x[neg_inds], bins=hedges)
+    np.histogram(y[neg_inds], bins=vedges)
+
+
+def selection_benchmarks(fraction):
+    # register both ways of computing a selection of this size
+    def np_histogram(n_points, n_bins):
+        x, y, inds = histogram_setup(n_points, n_bins, fraction)
+        _, hedges = np.histogram(x, bins=n_bins)
+        _, vedges = np.histogram(y, bins=n_bins)
+        return (lambda: np_histogram_update(x, y, inds, hedges, vedges),
+                n_points)
+
+    def selection_histogram(n_points, n_bins):
+        x, y, inds = histogram_setup(n_points, n_bins, fraction)
+        x_hist = SelectionHistogram(x, bins=n_bins)
+        y_hist = SelectionHistogram(y, bins=n_bins)
+        return (lambda: (x_hist.counts(inds), y_hist.counts(inds)),
+                n_points)
+
+    def cumulative_histogram(n_points, n_bins):
+        # what the server app does: cumulative fine counts of the
+        # selection, rebinned to the shown bins
+        x, y, inds = histogram_setup(n_points, n_bins, fraction)
+        hists = [CumulativeHistogram(values, bins=FINE_BINS * n_bins)
+                 for values in (x, y)]
+        layouts = [hist.layout(hist.edges[0], hist.edges[-1], n_bins)
+                   for hist in hists]
+
+        def run():
+            for hist, layout in zip(hists, layouts):
+                hist.rebin(hist.selected_cumulative(inds), layout)
+        return run, n_points
+
+    for setup in (np_histogram, selection_histogram, cumulative_histogram):
+        setup.__name__ += '_select{:g}'.format(fraction)
+        benchmark('histogram', uses_bins=True)(setup)
+
+
+selection_benchmarks(0.001)
+selection_benchmarks(0.1)
+
+
+@benchmark('histogram', uses_bins=True)
+def selection_histogram_build(n_points, n_bins):
+    x, _ = make_xy(n_points)
+    return lambda: SelectionHistogram(x, bins=n_bins), n_points
+
+
+@benchmark('histogram', uses_bins=True)
+def cumulative_histogram_build(n_points, n_bins):
+    x, _ = make_xy(n_points)
+    return (lambda: CumulativeHistogram(x, bins=FINE_BINS * n_bins),
+            n_points)
+
+
+@benchmark('histogram', uses_bins=True)
+def cumulative_histogram_zoom(n_points, n_bins):
+    # rebinning to the visible range after a pan or zoom
+    x, _ = make_xy(n_points)
+    hist = CumulativeHistogram(x, bins=FINE_BINS * n_bins)
+    low, high = np.percentile(x, [40, 60])
+
+    def run():
+        hist.rebin(hist.cumulative, hist.layout(low, high, n_bins))
+    return run, n_bins
+
+
+# ~~~~~~~~~~~~~~ fitting ~~~~~~~~~~~~~~ #
+def fit_setup(n_points, n_bins):
+    x, _ = make_xy(n_points)
+    counts, edges = np.histogram(x, bins=n_bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    return centers, counts
+
+
+@benchmark('fit', uses_bins=True)
+def do_fit(n_points, n_bins):
+    centers, counts = fit_setup(n_points, n_bins)
+    low, high = np.percentile(centers, [10, 90])
+    return lambda: fit_gaussian(centers, counts, low, high), n_bins
+
+
+@benchmark('fit', uses_bins=True)
+def do_fit_refined(n_points, n_bins):
+    centers, counts = fit_setup(n_points, n_bins)
+    low, high = np.percentile(centers, [10, 90])
+    return (lambda: fit_gaussian(centers, counts, low, high, refine=True),
+            n_bins)
+
+
+@benchmark('fit', uses_bins=True)
+def do_fit_rebinned(n_points, n_bins):
+    # the server app's do_fit: rebin a selection, then fit it
+    x, _, inds = histogram_setup(n_points, n_bins, 0.1)
+    hist = CumulativeHistogram(x, bins=FINE_BINS * n_bins)
+    layout = hist.layout(hist.edges[0], hist.edges[-1], n_bins)
+    selection = hist.selected_cumulative(inds)
+    edges = hist.edges[layout]
+    centers = (edges[:-1] + edges[1:]) / 2
+    low, high = np.percentile(centers, [10, 90])
+
+    def run():
+        fit_gaussian(centers, hist.rebin(selection, layout), low, high)
+    return run, n_bins
+
+
+# ~~~~~~~~~~~~~~ aggregation ~~~~~~~~~~~~~~ #
+def aggregate_setup(n_points, npartitions):
+    import datashader as ds
+    import pandas as pd
+
+    x, y = make_xy(n_points)
+    frame = pd.DataFrame({'x': x, 'y': y})
+    if npartitions > 1:
+        import dask.dataframe as dd
+        frame = dd.from_pandas(frame, npartitions=npartitions, sort=False)
+    canvas = ds.Canvas(plot_width=600, plot_height=600,
+                       x_range=(-10, 10), y_range=(-10, 10))
+    return lambda: canvas.points(frame, 'x', 'y'), n_points
+
+
+@benchmark('shade')
+def aggregate_single(n_points, n_bins):
+    return aggregate_setup(n_points, 1)
+
+
+@benchmark('shade')
+def aggregate_parallel(n_points, n_bins):
+    # one partition per core, aggregated on dask's thread pool
+    return aggregate_setup(n_points, os.cpu_count() or 1)
+
+
+# ~~~~~~~~~~~~~~ streaming ~~~~~~~~~~~~~~ #
+def stream_source():
+    doc = Document()
+    source = ColumnDataSource(data=dict(x=[], y=[]))
+    doc.add_root(source)
+    return source
+
+
+@benchmark('stream')
+def stream_per_point(n_points, n_bins):
+    # the 02-streaming loop: one stream() call per generated point, capped
+    # since it is far too slow for the larger sizes
+    n_points = min(n_points, 10000)
+
+    def run():
+        source = stream_source()
+        for _ in range(n_points):
+            source.stream(dict(x=[np.random.normal()], y=[np.random.normal()]))
+    return run, n_points
+
+
+@benchmark('stream')
+def stream_batched(n_points, n_bins):
+    n_new = 20  # points generated per step
+
+    def run():
+        source = stream_source()
+        with BatchedStreamer(batch_size=5000, interval=0.05) as streamer:
+            for _ in range(n_points // n_new):
+                streamer.add(source, x=np.random.normal(size=n_new),
+                             y=np.random.normal(size=n_new))
+    return run, n_points
+
+
+# ~~~~~~~~~~~~~~ running and recording ~~~~~~~~~~~~~~ #
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=here,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def previous_results(path, revision):
+    '''Latest recorded result of each benchmark from another revision.'''
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                result = json.loads(line)
+                if result['revision'] != revision:
+                    previous[result['key']] = result
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    parser.add_argument('--bins', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', default=None,
+                        help='groups or benchmark names to run')
+    parser.add_argument('--results', default=default_results)
+    args = parser.parse_args()
+
+    revision = git_revision()
+    previous = previous_results(args.results, revision)
+    timestamp = datetime.datetime.now().isoformat(timespec='seconds')
+
+    print('{:<44} {:>10} {:>6} {:>10} {:>12} {:>9} {:>8}'.format(
+        'benchmark', 'points', 'bins', 'time [ms]', 'items/s', 'peak [MB]',
+        'vs prev'))
+
+    with open(args.results, 'a') as results:
+        for group, name, uses_bins, setup in benchmarks:
+            if args.only and group not in args.only and name not in args.only:
+                continue
+            for n_points in args.sizes:
+                for n_bins in (args.bins if uses_bins else [None]):
+                    run, n_items = setup(n_points, n_bins)
+                    seconds, peak = measure(run, args.repeat)
+
+                    key = '{}.{}[{},{}]'.format(group, name, n_points, n_bins)
+                    result = dict(
+                        key=key, group=group, name=name, n_points=n_points,
+                        n_bins=n_bins, seconds=seconds,
+                        throughput=n_items / seconds, peak_bytes=peak,
+                        revision=revision, timestamp=timestamp,
+                    )
+                    results.write(json.dumps(result) + '\n')
+
+                    change = ''
+                    if key in previous:
+                        change = '{:.2f}x'.format(
+                            previous[key]['seconds'] / seconds)
+                    print('{:<44} {:>10} {:>6} {:>10.3f} {:>12.4g} {:>9.1f} '
+                          '{:>8}'.format(
+                              group + '.' + name, n_points, n_bins or '-',
+                              seconds * 1e3, n_items / seconds, peak / 2**20,
+                              change))
+
+
+if __name__ == '__main__':
+    main()
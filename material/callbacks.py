@@ -0,0 +1,191 @@
+'''
+Run slow Bokeh callbacks off the server's event loop.
+
+A callback that does heavy NumPy/SciPy work blocks every session served by
+the same ``bokeh serve`` process.  ``Offloaded`` splits such a callback in
+three steps:
+
+  - ``prepare(*args)`` runs on the event loop and gathers the inputs, e.g.
+    widget values and column data, since models must not be read from
+    another thread
+  - ``compute(*inputs)`` runs in a shared thread pool
+  - ``apply(result)`` runs on the event loop, via
+    ``doc.add_next_tick_callback``, and updates the models
+
+Only one computation per callback is in flight at a time.  Events arriving
+meanwhile are coalesced, so only the latest is computed next, and a result
+that is already out of date when it finishes is discarded, unless
+``apply_superseded`` asks for it to be shown anyway, e.g. so that a live
+selection keeps updating while computations take longer than the gap
+between events.
+
+    slider.on_change('value', Offloaded(curdoc(), compute, apply, prepare))
+
+``Throttled`` caps the rate of a callback fired by a fast stream of events,
+such as a live lasso selection, keeping only the latest of the events
+that arrive too soon:
+
+    lasso = Throttled(curdoc(), update, rate=30)
+
+``on_ranges_change`` similarly collapses the burst of range changes made by
+one pan or zoom into a single callback.
+
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import inspect
+import logging
+import os
+import time
+
+log = logging.getLogger(__name__)
+
+# shared by every session in the server process
+executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 4)
+
+
+class Offloaded(object):
+    '''
+    Callback that computes in ``executor`` and applies on ``doc``.
+
+    ``prepare`` defaults to passing the callback arguments straight to
+    ``compute``.  The callback reports the signature of ``prepare`` (or
+    ``compute``), which Bokeh checks when it is registered.  With ``delay``
+    (in milliseconds), a computation only starts once no new event has
+    arrived for that long.  With ``apply_superseded``, results are applied
+    even when newer events arrived while they were computed.  Any ``concurrent.futures`` executor can be
+    given; a process pool needs ``compute`` and its inputs to be picklable.
+    '''
+
+    def __init__(self, doc, compute, apply, prepare=None, delay=None,
+                 executor=executor, apply_superseded=False):
+        self.doc = doc
+        self.compute = compute
+        self.apply = apply
+        self.prepare = prepare
+        self.delay = delay
+        self.executor = executor
+        self.apply_superseded = apply_superseded
+        self.__signature__ = inspect.signature(prepare or compute)
+
+        self._latest = None  # inputs waiting to be computed
+        self._generation = 0  # counts the events received
+        self._running = False
+
+    def __call__(self, *args):
+        self._latest = args if self.prepare is None else self.prepare(*args)
+        self._generation += 1
+
+        if self.delay:
+            self.doc.add_timeout_callback(
+                partial(self._debounced, self._generation), self.delay)
+        elif not self._running:
+            self._submit()
+
+    def _debounced(self, generation):
+        # only the last of a burst of events starts a computation
+        if generation == self._generation and not self._running:
+            self._submit()
+
+    def _submit(self):
+        inputs, self._latest = self._latest, None
+        generation = self._generation
+        self._running = True
+
+        future = self.executor.submit(self.compute, *inputs)
+        future.add_done_callback(partial(self._schedule, generation))
+
+    def _schedule(self, generation, future):
+        # called from the worker thread: hand the result to the event loop
+        self.doc.add_next_tick_callback(partial(self._done, generation, future))
+
+    def _done(self, generation, future):
+        self._running = False
+        try:
+            if generation == self._generation or self.apply_superseded:
+                self.apply(future.result())
+            elif future.exception() is not None:
+                raise future.exception()
+        except Exception:
+            log.exception('offloaded callback failed')
+
+        # start on the newest event that arrived while computing
+        if self._latest is not None and generation != self._generation:
+            if self.delay:
+                self._debounced(self._generation)
+            else:
+                self._submit()
+
+
+class Throttled(object):
+    '''
+    Callback passing at most ``rate`` calls per second on to ``callback``.
+
+    A call arriving less than ``1 / rate`` seconds after the last one
+    passed on is held back, replacing any call already held, and made once
+    the interval is over, so the last call of a burst is never lost.
+    ``flush`` passes a call on at once, e.g. for the final event of a
+    gesture, and drops the call held back.  Like ``Offloaded``, it reports
+    the signature of ``callback``.
+    '''
+
+    def __init__(self, doc, callback, rate=30):
+        self.doc = doc
+        self.callback = callback
+        self.interval = 1.0 / rate
+        self.__signature__ = inspect.signature(callback)
+
+        self._latest = None  # arguments of the call held back
+        self._last = float('-inf')  # when the last call was passed on
+        self._scheduled = False
+
+    def __call__(self, *args):
+        self._latest = args
+        if self._scheduled:
+            return
+        wait = self._last + self.interval - time.monotonic()
+        if wait <= 0:
+            self._run()
+        else:
+            self._scheduled = True
+            self.doc.add_timeout_callback(self._trailing, wait * 1000)
+
+    def _trailing(self):
+        self._scheduled = False
+        if self._latest is not None:
+            self._run()
+
+    def _run(self):
+        args, self._latest = self._latest, None
+        self._last = time.monotonic()
+        self.callback(*args)
+
+    def flush(self, *args):
+        '''Pass this call on now, dropping any call held back.'''
+        self._latest = args
+        self._run()
+
+
+def on_ranges_change(plot, doc, callback):
+    '''
+    Call ``callback()`` once after the ranges of ``plot`` change.
+
+    A pan or zoom changes several range attributes at once; the callback
+    runs on the next tick, after they have all arrived, instead of once
+    for each of them.
+    '''
+    pending = [False]
+
+    def run():
+        pending[0] = False
+        callback()
+
+    def changed(attr, old, new):
+        if not pending[0]:
+            pending[0] = True
+            doc.add_next_tick_callback(run)
+
+    for plot_range in (plot.x_range, plot.y_range):
+        plot_range.on_change('start', changed)
+        plot_range.on_change('end', changed)
@@ -0,0 +1,155 @@
+'''
+On-disk cache of generated arrays, addressed by what they are made from.
+
+Drawing millions of random points takes much longer than reading them back.
+A ``DatasetCache`` stores each array as a ``.npy`` file named after a hash
+of the parameters that determine it, and returns it memory-mapped, so a
+restarted server or a re-run notebook pages the data in instead of
+generating it again, and server processes share one copy of it through the
+page cache:
+
+    cache = DatasetCache(max_bytes=2 * 2**30)
+    params = dict(mu=mu, sigma=sigma, n_points=n_points, seed=0,
+                  dtype='<f4')
+    points = cache.array(params, lambda filename: np.save(filename, draw()))
+
+Reading an array marks it as recently used, and when the files outgrow
+``max_bytes`` the least recently used ones are deleted.  The parameters
+must determine the array completely, so never cache data drawn without a
+seed.
+
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+default_directory = os.path.join(tempfile.gettempdir(), 'gaussian-dataset-cache')
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.dtype) or (isinstance(value, type) and
+                                       issubclass(value, np.generic)):
+        return np.dtype(value).str
+    raise TypeError('cannot use {!r} in a cache key'.format(value))
+
+
+class DatasetCache(object):
+    '''
+    ``.npy`` files in ``directory`` (a temporary directory by default),
+    holding at most about ``max_bytes``.
+    '''
+
+    def __init__(self, directory=None, max_bytes=2 * 2**30):
+        self.directory = directory or default_directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, params):
+        '''Hash of the JSON of the ``params`` dict.'''
+        text = json.dumps(params, sort_keys=True, default=_jsonable)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, params):
+        return os.path.join(self.directory, self.key(params) + '.npy')
+
+    def array(self, params, build):
+        '''
+        The array determined by ``params``, as a read-only memory map.
+
+        On a miss, ``build(filename)`` must write it to the ``.npy`` file
+        ``filename``, e.g. with ``np.save`` or ``np.lib.format.open_memmap``.
+        A cached file that cannot be read is a miss too, and is replaced.
+        '''
+        path = self.path(params)
+        try:
+            os.utime(path)  # mark as recently used
+            return np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError):
+            # unreadable, e.g. written by a broken build: make it again
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        self._store(path, build)
+        self.evict(keep=path)
+        return np.load(path, mmap_mode='r')
+
+    def _store(self, path, build):
+        # write to a private file, then move it into place in one step, so
+        # a process never sees a partly written array
+        fd, tmp_path = tempfile.mkstemp(suffix='.npy', prefix='.tmp-',
+                                        dir=self.directory)
+        os.close(fd)
+        try:
+            build(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def entries(self):
+        '''(last use, bytes, path) of the cached files, oldest first.'''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.') or not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        '''Total bytes of the cached files.'''
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        '''
+        Delete the least recently used files, except ``keep``, until the
+        cache fits in ``max_bytes``.
+        '''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            # processes that mapped the file keep their mapping
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        '''Delete all the cached files.'''
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+default_cache = None
+
+
+def get_default_cache():
+    '''The cache in ``default_directory``, created on first use.'''
+    global default_cache
+    if default_cache is None:
+        default_cache = DatasetCache()
+    return default_cache
@@ -0,0 +1,138 @@
+'''
+Generate 2D points drawn from several Gaussian distributions.
+
+All the distributions are drawn in a single pass, straight into the output
+array, one chunk at a time, so peak memory is the output itself plus
+nothing.  The output can be ``float32`` and can be a memory-mapped ``.npy``
+file, which lets the point count grow past what fits in RAM.
+
+    points = gaussian_points(mu, sigma, 1000000, dtype=np.float32)
+
+    for chunk in iter_gaussian_points(mu, sigma, 10**8):
+        ...
+
+``cached_gaussian_points`` stores the points of a given seed on disk the
+first time they are asked for and memory-maps them afterwards.
+
+    points = cached_gaussian_points(mu, sigma, 1000000, seed=0)
+
+``gaussian_frame`` splits the points into a dask DataFrame, one partition
+per core by default, which Datashader aggregates in parallel.
+
+'''
+
+import math
+import os
+
+import numpy as np
+
+from dataset_cache import get_default_cache
+
+
+def _fill(out, start, mu, sigma, bounds, rng):
+    '''
+    Fill ``out`` with rows ``start:start + len(out)`` of the point set, where
+    distribution ``i`` has rows ``bounds[i]:bounds[i + 1]``.
+    '''
+    rng.standard_normal(out.shape, dtype=out.dtype, out=out)
+
+    # scale and shift the rows of each distribution in place
+    stop = start + len(out)
+    first = np.searchsorted(bounds, start, side='right') - 1
+    for i in range(first, len(sigma)):
+        if bounds[i] >= stop:
+            break
+        i_first = max(bounds[i], start) - start
+        i_last = min(bounds[i + 1], stop) - start
+        out[i_first:i_last] *= sigma[i]
+        out[i_first:i_last] += mu[i]
+
+
+def _check(mu, sigma, n_points):
+    mu = np.asarray(mu, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+    assert len(mu) == len(sigma)
+    counts = np.broadcast_to(np.asarray(n_points, dtype=np.int64),
+                             (len(sigma),))
+    return mu, sigma, np.concatenate(([0], np.cumsum(counts)))
+
+
+def iter_gaussian_points(mu, sigma, n_points=10000, chunk_size=1000000,
+                         dtype=np.float64, seed=None):
+    '''
+    Yield the points of ``gaussian_points`` as arrays of at most
+    ``chunk_size`` rows.
+    '''
+    mu, sigma, bounds = _check(mu, sigma, n_points)
+    rng = np.random.default_rng(seed)
+    n_total = bounds[-1]
+
+    for start in range(0, n_total, chunk_size):
+        chunk = np.empty((min(chunk_size, n_total - start), 2), dtype=dtype)
+        _fill(chunk, start, mu, sigma, bounds, rng)
+        yield chunk
+
+
+def gaussian_points(mu, sigma, n_points=10000, dtype=np.float64,
+                    filename=None, chunk_size=1000000, seed=None):
+    '''
+    Draw ``n_points`` (x, y) points from each Gaussian distribution.
+
+    ``mu`` holds one (x, y) center per distribution and ``sigma`` the
+    matching standard deviations, either one per distribution or an (x, y)
+    pair.  ``n_points`` can also give the number of points of each
+    distribution.  The points of distribution ``i`` follow those of
+    distribution ``i - 1`` in the returned ``(n_total, 2)`` array.  If
+    ``filename`` is given, the points are written to a ``.npy`` file and
+    returned as a ``np.memmap``.
+    '''
+    mu, sigma, bounds = _check(mu, sigma, n_points)
+    rng = np.random.default_rng(seed)
+    # plain ints: numpy >= 2 writes np.int64 into the .npy header as a
+    # repr that np.load cannot parse
+    shape = (int(bounds[-1]), 2)
+
+    if filename is None:
+        points = np.empty(shape, dtype=dtype)
+    else:
+        points = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype,
+                                           shape=shape)
+
+    for start in range(0, shape[0], chunk_size):
+        _fill(points[start:start + chunk_size], start, mu, sigma, bounds,
+              rng)
+
+    if filename is not None:
+        points.flush()
+
+    return points
+
+
+def cached_gaussian_points(mu, sigma, n_points=10000, dtype=np.float64,
+                           seed=0, cache=None):
+    '''
+    ``gaussian_points``, drawn once and then read back from ``cache`` (see
+    dataset_cache.py) as a read-only memory map.
+    '''
+    if cache is None:
+        cache = get_default_cache()
+    mu, sigma, bounds = _check(mu, sigma, n_points)
+    params = dict(kind='gaussian_points', mu=mu, sigma=sigma,
+                  n_points=np.diff(bounds), seed=seed,
+                  dtype=np.dtype(dtype).str)
+    return cache.array(params, lambda filename: gaussian_points(
+        mu, sigma, np.diff(bounds), dtype, filename, seed=seed))
+
+
+def gaussian_frame(points, columns=('x', 'y'), npartitions=None):
+    '''
+    The ``(n, 2)`` ``points`` array as a dask DataFrame of ``npartitions``
+    partitions (the number of cores by default) with the given column
+    names.  The partitions are slices of ``points``, read as they are
+    needed, so memory-mapped points are not loaded up front.
+    '''
+    import dask.dataframe as dd
+
+    npartitions = npartitions or os.cpu_count() or 1
+    chunk_size = max(math.ceil(len(points) / npartitions), 1)
+    return dd.from_array(points, chunksize=chunk_size, columns=list(columns))
@@ -0,0 +1,139 @@
+'''
+Fit Gaussians to histogram counts.
+
+Fitting is done in closed form, from either the weighted moments of the
+bin centers or a weighted least-squares parabola through the log of the
+counts.  Both work on any number of histograms and fit ranges at once:
+``counts`` may have leading dimensions, and ``low``/``high`` broadcast
+against them, so a whole set of selections or slider positions is fit in
+one vectorized call.  ``scipy.optimize.curve_fit`` is only used when a
+refinement of a single fit is asked for.
+
+    mu, sigma, scale = fit_gaussian(centers, counts, low, high)
+    fit_y = gaussian_curve(centers, mu, sigma, scale)
+
+'''
+
+import numpy as np
+
+from pdf import gaussian_pdf
+
+
+def gaussian_curve(x, mu, sigma, scale=1.0):
+    '''``scale`` times the Gaussian probability density at ``x``.'''
+    curve = gaussian_pdf(x, mu, sigma)
+    curve *= np.reshape(scale, np.shape(scale) + (1,) * np.ndim(x))
+    return curve
+
+
+def _in_range(centers, counts, low, high):
+    centers = np.asarray(centers, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    low = -np.inf if low is None else np.asarray(low, dtype=float)[..., None]
+    high = np.inf if high is None else np.asarray(high, dtype=float)[..., None]
+    mask = (centers >= low) & (centers <= high)
+    return centers, np.where(mask, counts, 0.0)
+
+
+def _moments(centers, weights, bin_width):
+    total = weights.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mu = (weights * centers).sum(axis=-1) / total
+        var = (weights * (centers - mu[..., None]) ** 2).sum(axis=-1) / total
+    return mu, np.sqrt(var), total * bin_width
+
+
+def _log_parabola(centers, weights):
+    # work in t = (x - x0) / dx to keep the normal equations well scaled
+    x0 = centers.mean()
+    dx = max(np.ptp(centers) / 2, np.finfo(float).tiny)
+    t = (centers - x0) / dx
+
+    # weight each log count by its count, i.e. by 1 / var(log(count))
+    with np.errstate(divide='ignore'):
+        log_counts = np.where(weights > 0, np.log(weights), 0.0)
+    powers = t ** np.arange(5)[:, None]  # t**0 ... t**4
+    s = (weights[..., None, :] * powers).sum(axis=-1)
+    b = (weights[..., None, :] * log_counts[..., None, :] *
+         powers[:3]).sum(axis=-1)
+    a = np.stack([s[..., 0:3], s[..., 1:4], s[..., 2:5]], axis=-2)
+
+    # singular systems (fewer than 3 filled bins) are marked as failed
+    ok = np.asarray(np.abs(np.linalg.det(a)) > 1e-12 * s[..., 0] ** 3)
+    a = np.where(ok[..., None, None], a, np.eye(3))
+    c0, c1, c2 = np.moveaxis(np.linalg.solve(a, b[..., None])[..., 0], -1, 0)
+
+    ok = ok & (c2 < 0)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        mu_t = -c1 / (2 * c2)
+        sigma_t = np.sqrt(-1 / (2 * c2))
+        peak = np.exp(c0 - c1 ** 2 / (4 * c2))
+    mu = x0 + dx * mu_t
+    sigma = dx * sigma_t
+    return mu, sigma, peak * np.sqrt(2 * np.pi) * sigma, ok
+
+
+def fit_gaussians(centers, counts, low=None, high=None,
+                  method='log-parabola'):
+    '''
+    Fit ``gaussian_curve`` to each histogram in ``counts``.
+
+    ``centers`` are the bin centers (assumed evenly spaced) and ``counts``
+    is an array of shape ``(..., len(centers))``.  Only bins with centers
+    between ``low`` and ``high`` are used.  ``method`` is ``'moments'`` or
+    ``'log-parabola'``; the latter handles truncated ranges better and
+    falls back to the moments where the parabola cannot be fit.  Returns
+    the ``mu``, ``sigma`` and ``scale`` arrays, NaN where no Gaussian
+    can be fit (no counts, or all in one bin).
+    '''
+    centers, weights = _in_range(centers, counts, low, high)
+    bin_width = centers[1] - centers[0] if len(centers) > 1 else 1.0
+    mu, sigma, scale = _moments(centers, weights, bin_width)
+
+    if method == 'log-parabola':
+        p_mu, p_sigma, p_scale, ok = _log_parabola(centers, weights)
+        mu = np.where(ok, p_mu, mu)
+        sigma = np.where(ok, p_sigma, sigma)
+        scale = np.where(ok, p_scale, scale)
+    elif method != 'moments':
+        raise ValueError('unknown fit method: {}'.format(method))
+
+    # a single filled bin has no spread to fit
+    failed = ~(sigma > 0)
+    mu = np.where(failed, np.nan, mu)
+    sigma = np.where(failed, np.nan, sigma)
+    scale = np.where(failed, np.nan, scale)
+    return mu, sigma, scale
+
+
+def refine_fit(centers, counts, guess, low=None, high=None):
+    '''
+    Polish a single fit, ``guess = (mu, sigma, scale)``, with a nonlinear
+    least-squares fit.
+    '''
+    import scipy.optimize
+
+    centers, weights = _in_range(centers, counts, low, high)
+    mask = weights > 0
+    (mu, sigma, scale), _ = scipy.optimize.curve_fit(
+        gaussian_curve,
+        centers[mask],
+        weights[mask],
+        p0=guess,
+        bounds=([-np.inf, 0, 0], [np.inf, np.inf, np.inf]),
+    )
+    return mu, sigma, scale
+
+
+def fit_gaussian(centers, counts, low=None, high=None,
+                 method='log-parabola', refine=False):
+    '''
+    Fit a single histogram; see ``fit_gaussians``.  With ``refine=True``
+    the closed-form fit is used as the starting point of ``refine_fit``.
+    '''
+    mu, sigma, scale = (float(p) for p in fit_gaussians(
+        centers, counts, low, high, method))
+    if refine and np.isfinite([mu, sigma, scale]).all() and sigma > 0:
+        mu, sigma, scale = refine_fit(centers, counts, (mu, sigma, scale),
+                                      low, high)
+    return mu, sigma, scale
@@ -1,6 +1,8 @@
 # hello_server.py
 
 # 0. imports
+import os
+
 from bokeh.io import curdoc
 from bokeh.layouts import column
 from bokeh.models.widgets import TextInput, Button, Paragraph
@@ -21,3 +23,10 @@ layout = column(button, input, output)
 
 # 4. add the layout to curdoc
 curdoc().add_root(layout)
+
+# 5. (optional) report the server metrics at http://localhost:9100/metrics
+#    when started with: METRICS_PORT=9100 bokeh serve hello_server.py
+if os.environ.get('METRICS_PORT'):
+    from metrics import install, start_http_server
+    install(curdoc())
+    start_http_server(int(os.environ['METRICS_PORT']))
@@ -0,0 +1,155 @@
+'''
+Histogram helpers for linked selection histograms.
+
+Assigning every point to a bin is the expensive part of ``np.histogram``.
+A ``SelectionHistogram`` does that once, up front, so the counts for any
+selection cost a ``np.bincount`` over just the selected points.
+
+    hist = SelectionHistogram(x, bins=100)
+    selected, unselected = hist.counts(inds)
+
+A ``CumulativeHistogram`` bins the points much finer than they are shown
+and keeps cumulative counts, so that the histogram of any range, e.g. the
+visible part of a zoomed plot, is read off in O(bins) instead of binning
+all the points again:
+
+    hist = CumulativeHistogram(x, bins=4000)
+    layout = hist.layout(x0, x1, n_bins=100)
+    edges = hist.edges[layout]
+    counts = hist.rebin(hist.cumulative, layout)
+
+``update_column`` then sends a new histogram to the browser as a patch of
+the bins that changed, rather than as a whole new column.
+
+'''
+
+import numpy as np
+
+
+def bin_index(data, edges):
+    '''
+    Return the bin of each value in ``data``, following ``np.histogram``:
+    bins are half-open except the last, which includes its right edge.
+    Values outside the edges (or NaN) are given the overflow bin
+    ``len(edges) - 1``.
+    '''
+    data = np.asarray(data)
+    n_bins = len(edges) - 1
+    inds = np.searchsorted(edges, data, side='right') - 1
+    inds[data == edges[-1]] = n_bins - 1
+    inds[(inds < 0) | (inds >= n_bins)] = n_bins
+
+    # the smallest integer type keeps the index array cheap to hold
+    dtype = np.uint16 if n_bins < np.iinfo(np.uint16).max else np.int32
+    return inds.astype(dtype)
+
+
+class SelectionHistogram(object):
+    '''
+    Precomputed bin assignment of one data array.
+
+    ``data`` and ``bins`` are passed as for ``np.histogram``; ``edges`` and
+    ``total`` match what ``np.histogram(data, bins)`` would return.
+    '''
+
+    def __init__(self, data, bins=10, range=None):
+        edges = np.histogram_bin_edges(data, bins=bins, range=range)
+
+        self.edges = edges
+        self.n_bins = len(edges) - 1
+        self.n_points = len(data)
+        self.bins = bin_index(data, edges)
+        self.total = self._bincount(self.bins)
+
+    def _bincount(self, bins):
+        # the extra (overflow) bin collects out of range points
+        return np.bincount(bins, minlength=self.n_bins + 1)[:self.n_bins]
+
+    def selected(self, inds):
+        '''Counts for the points at ``inds``.'''
+        return self._bincount(self.bins[inds])
+
+    def counts(self, inds):
+        '''
+        Counts for the points at ``inds`` and for all the other points.
+
+        Only the selected points are touched; the unselected counts are
+        the total minus the selected counts.  ``inds`` must not contain
+        repeated indices.
+        '''
+        selected = self.selected(inds)
+        return selected, self.total - selected
+
+
+class CumulativeHistogram(SelectionHistogram):
+    '''
+    ``SelectionHistogram`` over many fine bins, with the cumulative counts
+    of all the points in ``cumulative``.
+
+    Shown bins are made of whole fine bins, so any bin layout is a subset
+    of the fine ``edges``, given by their indices (see ``layout``), and the
+    counts in it are differences of cumulative counts (see ``rebin``).
+    '''
+
+    def __init__(self, data, bins=4096, range=None):
+        super(CumulativeHistogram, self).__init__(data, bins, range)
+        self.cumulative = self.accumulate(self.total)
+
+    def accumulate(self, counts):
+        '''Cumulative sum of fine ``counts``, starting with 0.'''
+        return np.concatenate(([0], np.cumsum(counts)))
+
+    def selected_cumulative(self, inds):
+        '''Cumulative fine counts for the points at ``inds``.'''
+        return self.accumulate(self.selected(inds))
+
+    def layout(self, low, high, n_bins=100):
+        '''
+        Indices of the fine edges of at most ``n_bins`` bins of equal width
+        covering ``[low, high]``, widened to a whole number of fine bins
+        each.  When the range spans fewer than ``n_bins`` fine bins, those
+        are the bins.  Bins that would pass the last fine edge are moved
+        back, or dropped if the range is too close to the full width;
+        ``bins`` a multiple of ``n_bins`` avoids that.
+        '''
+        low, high = sorted((low, high))
+        first = np.searchsorted(self.edges, low, side='right') - 1
+        last = np.searchsorted(self.edges, high, side='left')
+        first = int(np.clip(first, 0, self.n_bins - 1))
+        last = int(np.clip(last, first + 1, self.n_bins))
+
+        span = last - first
+        step = -(-span // n_bins)  # fine bins per shown bin
+        count = -(-span // step)
+        first = max(0, min(first, self.n_bins - step * count))
+        count = min(count, (self.n_bins - first) // step)
+        return first + step * np.arange(count + 1, dtype=np.intp)
+
+    def rebin(self, cumulative, layout):
+        '''Counts in the bins of ``layout``, from ``cumulative`` counts.'''
+        return np.diff(cumulative[layout])
+
+
+def update_column(source, column, values, max_patch_fraction=0.25):
+    '''
+    Set ``source.data[column]`` to ``values``, sending only what changed.
+
+    If at most ``max_patch_fraction`` of the entries changed, they are
+    sent with ``source.patch``; otherwise the whole column is replaced.
+    The new column is always a private copy of ``values``, since patches
+    modify the column array in place.
+    '''
+    values = np.asarray(values)
+    current = source.data[column]
+
+    if (isinstance(current, np.ndarray) and current.shape == values.shape and
+            current.flags.writeable):
+        changed = np.flatnonzero(current != values)
+        if len(changed) == 0:
+            return
+        if len(changed) <= max_patch_fraction * len(values):
+            source.patch({column: list(zip(changed.tolist(),
+                                           values[changed].tolist()))})
+            return
+
+    source.data[column] = values.copy()
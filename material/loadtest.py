@@ -0,0 +1,292 @@
+'''
+Load test a Bokeh server app with many simulated sessions.
+
+Start the app with ``bokeh serve`` on localhost and drive it with
+``bokeh.client`` sessions, each replaying scripted widget changes, e.g.
+
+    python loadtest.py hello_server.py --sessions 50
+    python loadtest.py solutions/select_hello_server.py --sessions 50
+    python loadtest.py 04-gaussian-server.py --sessions 20 --actions 50 --args --scale 100
+
+Each simulated user opens a session, performs ``--actions`` scripted
+changes the server replies to (button clicks, slider drags, selections),
+and waits for the reply to each one.  Changes that only set up the next
+one, such as ``Select`` or text input values, are not counted.  The
+report gives the session open rate, the percentiles of the callback round
+trip (from making a change to receiving the document changes the server
+made in response) and the server memory per open session.  Everything runs on this machine.
+
+'''
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.request import urlopen
+
+import numpy as np
+
+from bokeh.client import pull_session
+from bokeh.models import Button, ColumnDataSource, Select, Slider, TextInput
+
+
+# ~~~~~~~~~~~~~~ scripted actions ~~~~~~~~~~~~~~ #
+def click(button):
+    # Bokeh versions with a ``clicks`` property run on_click callbacks when
+    # it changes; later ones only react to a ButtonClick event, which
+    # bokeh.client cannot send
+    if 'clicks' not in button.properties():
+        raise RuntimeError('this Bokeh version cannot click from a client')
+    button.clicks += 1
+
+
+def select_indices(source, inds):
+    if isinstance(source.selected, dict):
+        source.selected = {'0d': {'glyph': None, 'indices': []},
+                           '1d': {'indices': inds},
+                           '2d': {'indices': {}}}
+    else:
+        source.selected.indices = inds
+
+
+# each scenario yields (name, action, reply): whether the server is
+# expected to change the document in response to the action
+def button_actions(doc, rng):
+    buttons = list(doc.select({'type': Button}))
+    selects = list(doc.select({'type': Select}))
+    inputs = list(doc.select({'type': TextInput}))
+    for step in itertools.count():
+        # the selects and inputs only change what the next click shows
+        for select in selects:
+            yield 'select', lambda select=select: setattr(
+                select, 'value', str(rng.choice(select.options))), False
+        # a new name every time, so every click changes the output
+        for text in inputs:
+            yield 'input', lambda text=text: setattr(
+                text, 'value', 'user {}'.format(step)), False
+        for button in buttons:
+            yield 'click', lambda button=button: click(button), True
+
+
+def gaussian_actions(doc, rng):
+    sliders = list(doc.select({'type': Slider}))
+    # the scatter source is the one with the most points
+    sources = sorted(doc.select({'type': ColumnDataSource}),
+                     key=lambda source: len(source.data.get('x', [])))
+    scatter = sources[-1]
+    n_points = len(scatter.data['x'])
+    while True:
+        # drag each slider over a few positions, then select some points
+        for slider in sliders:
+            for value in np.linspace(slider.start, slider.end, 5)[1:-1]:
+                yield 'slider', lambda slider=slider, value=value: setattr(
+                    slider, 'value', float(value)), True
+        size = int(rng.integers(1, max(n_points // 10, 2)))
+        inds = rng.choice(n_points, size, replace=False).tolist()
+        yield 'select', lambda: select_indices(scatter, inds), True
+
+
+scenarios = {
+    'hello_server.py': button_actions,
+    'select_hello_server.py': button_actions,
+    '04-gaussian-server.py': gaussian_actions,
+}
+
+
+# ~~~~~~~~~~~~~~ server ~~~~~~~~~~~~~~ #
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port, app_args, num_procs):
+    command = [sys.executable, '-m', 'bokeh', 'serve', app,
+               '--port', str(port), '--num-procs', str(num_procs),
+               '--allow-websocket-origin', 'localhost:{}'.format(port)]
+    if app_args:
+        command += ['--args'] + app_args
+    return subprocess.Popen(command, cwd=os.path.dirname(app) or '.',
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+
+def wait_until_up(url, server, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('bokeh serve exited with {}'.format(
+                server.returncode))
+        try:
+            urlopen(url, timeout=5).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start within {} s'.format(timeout))
+
+
+def rss(pid):
+    '''Resident memory in bytes of a process and all its children.'''
+    total = 0
+    try:
+        with open('/proc/{}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    total += int(line.split()[1]) * 1024
+        children = '/proc/{0}/task/{0}/children'.format(pid)
+        with open(children) as f:
+            for child in f.read().split():
+                total += rss(int(child))
+    except OSError:
+        pass
+    return total
+
+
+# ~~~~~~~~~~~~~~ simulated users ~~~~~~~~~~~~~~ #
+class User(object):
+    '''One session replaying the scenario of its app.'''
+
+    def __init__(self, url, scenario, n_actions, seed, timeout):
+        self.url = url
+        self.scenario = scenario
+        self.n_actions = n_actions
+        self.rng = np.random.default_rng(seed)
+        self.timeout = timeout
+        self.opened_at = None
+        self.round_trips = []
+        self.errors = []
+
+    def wait_for_reply(self, session, replies):
+        # the server replies with document changes; request_server_info
+        # runs the client's event loop until the server has answered
+        start = time.perf_counter()
+        n_before = replies[0]
+        while replies[0] == n_before:
+            session.request_server_info()
+            if time.perf_counter() - start > self.timeout:
+                raise TimeoutError('no reply within {} s'.format(self.timeout))
+
+    def run(self, all_open, release):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        try:
+            session = pull_session(url=self.url)
+        except Exception as e:
+            self.errors.append(repr(e))
+            all_open.wait()
+            return
+        self.opened_at = time.perf_counter()
+
+        # count the changes that come from the server
+        replies = [0]
+
+        def count(event):
+            if getattr(event, 'setter', None) is session:
+                replies[0] += 1
+        session.document.on_change(count)
+
+        try:
+            actions = self.scenario(session.document, self.rng)
+            done = 0
+            while done < self.n_actions:
+                _, action, reply = next(actions)
+                start = time.perf_counter()
+                action()
+                if not reply:
+                    # one round trip, so the server has seen the change
+                    # before the next action
+                    session.request_server_info()
+                    continue
+                self.wait_for_reply(session, replies)
+                self.round_trips.append(time.perf_counter() - start)
+                done += 1
+        except Exception as e:
+            self.errors.append(repr(e))
+        finally:
+            # stay connected until the memory of all sessions is measured
+            all_open.wait()
+            release.wait()
+            session.close()
+
+
+def percentiles(values, qs=(50, 90, 99)):
+    if not values:
+        return ['-'] * len(qs)
+    return ['{:.1f}'.format(v * 1e3) for v in np.percentile(values, qs)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('app', help='path of the app to serve')
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--actions', type=int, default=20,
+                        help='scripted changes per session')
+    parser.add_argument('--num-procs', type=int, default=1,
+                        help='passed on to bokeh serve')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='seconds to wait for each reply')
+    parser.add_argument('--args', nargs=argparse.REMAINDER, default=[],
+                        help='arguments for the app')
+    args = parser.parse_args()
+
+    app = os.path.abspath(args.app)
+    name = os.path.basename(app)
+    if name not in scenarios:
+        parser.error('no scenario for {}, known apps: {}'.format(
+            name, ', '.join(sorted(scenarios))))
+
+    port = free_port()
+    url = 'http://localhost:{}/{}'.format(port, os.path.splitext(name)[0])
+    server = start_server(app, port, args.args, args.num_procs)
+    try:
+        wait_until_up(url, server)
+        base_rss = rss(server.pid)
+
+        users = [User(url, scenarios[name], args.actions, seed, args.timeout)
+                 for seed in range(args.sessions)]
+        all_open = threading.Barrier(args.sessions + 1)
+        release = threading.Event()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            for user in users:
+                pool.submit(user.run, all_open, release)
+            all_open.wait()
+            elapsed = time.perf_counter() - start
+            loaded_rss = rss(server.pid)
+            release.set()
+
+        opened = [user.opened_at for user in users
+                  if user.opened_at is not None]
+        round_trips = [t for user in users for t in user.round_trips]
+        errors = [error for user in users for error in user.errors]
+
+        print('app:                 {}'.format(name))
+        print('sessions opened:     {} of {}'.format(len(opened),
+                                                     args.sessions))
+        if opened:
+            print('sessions per second: {:.1f}'.format(
+                len(opened) / (max(opened) - start)))
+        print('wall time:           {:.1f} s'.format(elapsed))
+        print('round trips:         {}'.format(len(round_trips)))
+        print('round trip p50/p90/p99 [ms]: {}'.format(
+            ' / '.join(percentiles(round_trips))))
+        print('server memory:       {:.1f} MB idle, {:.1f} MB loaded, '
+              '{:.2f} MB per session'.format(
+                  base_rss / 2**20, loaded_rss / 2**20,
+                  (loaded_rss - base_rss) / 2**20 / max(len(opened), 1)))
+        if errors:
+            print('errors:              {} (first: {})'.format(len(errors),
+                                                               errors[0]))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+'''
+Bounded memoization of expensive results, such as selection histograms.
+
+Users of an app often go back and forth between the same views.  An
+``LRUCache`` keeps the results computed for the most recent keys, up to a
+total size in bytes, and counts its hits and misses in the metrics
+registry:
+
+    cache = LRUCache('histograms', max_bytes=64 * 2**20)
+    counts = cache.get(('hist', fingerprint(inds)), lambda: hist.counts(inds))
+
+``fingerprint`` reduces arrays and other values to a short hash, so that
+large selections make cheap keys.
+
+'''
+
+from collections import OrderedDict
+import hashlib
+import threading
+
+import numpy as np
+
+from metrics import registry
+
+
+def fingerprint(*values):
+    '''
+    Hash of the ``values``: arrays (by dtype, shape and contents), None,
+    numbers, strings and tuples or lists of these.
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+
+    def add(value):
+        if isinstance(value, np.ndarray):
+            digest.update('{}{}'.format(value.dtype.str, value.shape).encode())
+            digest.update(np.ascontiguousarray(value).data)
+        elif isinstance(value, (tuple, list)):
+            digest.update(b'(')
+            for item in value:
+                add(item)
+            digest.update(b')')
+        else:
+            digest.update(repr(value).encode())
+        digest.update(b',')
+
+    for value in values:
+        add(value)
+    return digest.hexdigest()
+
+
+def nbytes(value):
+    '''Approximate memory of ``value``, counting its arrays.'''
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(item) for item in value) + 8 * len(value)
+    if isinstance(value, dict):
+        return sum(nbytes(item) for item in value.values()) + 16 * len(value)
+    return 32
+
+
+def _read_only(value):
+    # cached arrays are handed to every caller, so must not be modified
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            _read_only(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _read_only(item)
+
+
+class LRUCache(object):
+    '''
+    Results by key, evicting the least recently used ones once they take
+    more than ``max_bytes`` (see ``nbytes``).  Safe to use from several
+    threads.  Hits and misses are counted as ``<name>.hit`` and
+    ``<name>.miss`` in the metrics registry.
+    '''
+
+    def __init__(self, name, max_bytes=64 * 2**20):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # key -> (value, size), oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, compute):
+        '''The result for ``key``, calling ``compute()`` on a miss.'''
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+        if item is not None:
+            registry.count(self.name + '.hit')
+            return item[0]
+
+        with self._lock:
+            self.misses += 1
+        registry.count(self.name + '.miss')
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        '''Store ``value``, unless it alone is larger than the cache.'''
+        size = nbytes(value)
+        if size > self.max_bytes:
+            return
+        _read_only(value)
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.nbytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
@@ -0,0 +1,271 @@
+'''
+Lightweight metrics for Bokeh server apps.
+
+Wrap callbacks with ``instrument`` to record how long they take, call
+``install`` once per session to count sessions and the size of the
+messages sent to the browser, and look at the numbers either in the app,
+with ``stats_panel``, or at a local HTTP endpoint in the Prometheus text
+format, started with ``start_http_server``:
+
+    button.on_click(instrument('say_hi', update))
+    install(curdoc())
+    start_http_server(9100)
+
+Timing a callback costs two clock reads and a bucket increment, and only a
+sample of the outgoing messages is serialized to measure its size, so the
+instrumentation is cheap enough to leave on.
+
+'''
+
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import logging
+import random
+import threading
+import time
+
+from bokeh.models.widgets import PreText
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = tuple(2 ** i for i in range(6, 28, 2))  # 64 B to 128 MB
+
+
+class Histogram(object):
+    '''Counts of observed values in fixed buckets, plus their sum.'''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        '''Upper bound of the bucket holding the ``q`` quantile.'''
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= target and n:
+                return bound
+        return float('nan')
+
+
+class Registry(object):
+    '''All the metrics of one server process.'''
+
+    def __init__(self):
+        self.latency = {}  # callback name -> Histogram
+        self.message_bytes = Histogram(SIZE_BUCKETS)
+        self.sessions = 0
+        self.payload_raw_bytes = 0  # column data before and after compacting
+        self.payload_sent_bytes = 0
+        self.counters = {}  # event name -> count, e.g. cache hits
+        self._lock = threading.Lock()
+
+    def observe_latency(self, name, seconds):
+        histogram = self.latency.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.latency.setdefault(
+                    name, Histogram(LATENCY_BUCKETS))
+        histogram.observe(seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe_payload(self, raw, sent):
+        with self._lock:
+            self.payload_raw_bytes += raw
+            self.payload_sent_bytes += sent
+
+    def session_opened(self):
+        with self._lock:
+            self.sessions += 1
+
+    def session_closed(self):
+        with self._lock:
+            self.sessions -= 1
+
+    def summary(self):
+        '''Plain text table of the metrics.'''
+        lines = ['active sessions: {}'.format(self.sessions), '',
+                 '{:<24} {:>7} {:>9} {:>9} {:>9}'.format(
+                     'callback', 'calls', 'p50 [ms]', 'p95 [ms]', 'p99 [ms]')]
+        for name, histogram in sorted(self.latency.items()):
+            lines.append('{:<24} {:>7} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+                name, histogram.count,
+                *(histogram.quantile(q) * 1e3 for q in (0.5, 0.95, 0.99))))
+
+        sizes = self.message_bytes
+        if sizes.count:
+            lines += ['', 'sampled messages: {}, mean {:.1f} kB, '
+                      'p95 <= {:.0f} kB'.format(
+                          sizes.count, sizes.sum / sizes.count / 1e3,
+                          sizes.quantile(0.95) / 1e3)]
+        if self.payload_raw_bytes:
+            lines += ['', 'compacted columns: {:.1f} kB sent for {:.1f} kB, '
+                      '{:.0%} saved'.format(
+                          self.payload_sent_bytes / 1e3,
+                          self.payload_raw_bytes / 1e3,
+                          1 - self.payload_sent_bytes / self.payload_raw_bytes)]
+        if self.counters:
+            lines.append('')
+            lines += ['{:<24} {:>7}'.format(name, n)
+                      for name, n in sorted(self.counters.items())]
+        return '\n'.join(lines)
+
+    def prometheus(self):
+        '''The metrics in the Prometheus text exposition format.'''
+        lines = ['# TYPE bokeh_sessions gauge',
+                 'bokeh_sessions {}'.format(self.sessions)]
+
+        def histogram_lines(metric, histogram, labels=''):
+            cumulative = 0
+            for bound, n in zip(histogram.buckets + ('+Inf',),
+                                histogram.counts):
+                cumulative += n
+                lines.append('{}_bucket{{{}le="{}"}} {}'.format(
+                    metric, labels, bound, cumulative))
+            labels = '{{{}}}'.format(labels.rstrip(',')) if labels else ''
+            lines.append('{}_sum{} {}'.format(metric, labels, histogram.sum))
+            lines.append('{}_count{} {}'.format(metric, labels,
+                                                histogram.count))
+
+        lines.append('# TYPE bokeh_callback_seconds histogram')
+        for name, histogram in sorted(self.latency.items()):
+            histogram_lines('bokeh_callback_seconds', histogram,
+                            'callback="{}",'.format(name))
+        lines.append('# TYPE bokeh_message_bytes histogram')
+        histogram_lines('bokeh_message_bytes', self.message_bytes)
+        lines += ['# TYPE bokeh_payload_raw_bytes_total counter',
+                  'bokeh_payload_raw_bytes_total {}'.format(
+                      self.payload_raw_bytes),
+                  '# TYPE bokeh_payload_sent_bytes_total counter',
+                  'bokeh_payload_sent_bytes_total {}'.format(
+                      self.payload_sent_bytes)]
+        lines.append('# TYPE bokeh_events_total counter')
+        for name, n in sorted(self.counters.items()):
+            lines.append('bokeh_events_total{{name="{}"}} {}'.format(name, n))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+# ~~~~~~~~~~~~~~ callbacks ~~~~~~~~~~~~~~ #
+def instrument(name, callback):
+    '''Wrap ``callback`` so each call's duration is recorded as ``name``.'''
+    @wraps(callback)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            registry.observe_latency(name, time.perf_counter() - start)
+    return timed
+
+
+# ~~~~~~~~~~~~~~ sessions and messages ~~~~~~~~~~~~~~ #
+def message_size(event):
+    '''Bytes of the PATCH-DOC message that sends ``event`` to the browser.'''
+    from bokeh.protocol import Protocol
+    try:
+        protocol = Protocol()
+    except TypeError:  # older Bokeh versions take the protocol version
+        protocol = Protocol("1.0")
+
+    message = protocol.create('PATCH-DOC', [event])
+    size = (len(message.header_json) + len(message.metadata_json) +
+            len(message.content_json))
+    for buffer in message.buffers:
+        payload = buffer[1] if isinstance(buffer, tuple) else buffer.data
+        size += len(payload)
+    return size
+
+
+def install(doc, sample_rate=0.05):
+    '''
+    Count ``doc`` as an active session until it is destroyed, and measure
+    the size of a ``sample_rate`` fraction of the changes sent from it.
+    '''
+    registry.session_opened()
+    doc.on_session_destroyed(lambda session_context: registry.session_closed())
+
+    def measure(event):
+        # changes made by the browser have a setter and are not sent back
+        if getattr(event, 'setter', None) is None and \
+                random.random() < sample_rate:
+            try:
+                registry.message_bytes.observe(message_size(event))
+            except Exception:
+                log.debug('could not measure %r', event, exc_info=True)
+
+    doc.on_change(measure)
+
+
+def stats_panel(doc, period=2000):
+    '''A text widget showing the metrics, refreshed every ``period`` ms.'''
+    panel = PreText(text=registry.summary(), width=600)
+
+    def refresh():
+        panel.text = registry.summary()
+
+    doc.add_periodic_callback(refresh, period)
+    return panel
+
+
+# ~~~~~~~~~~~~~~ HTTP endpoint ~~~~~~~~~~~~~~ #
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.rstrip('/') not in ('', '/metrics'):
+            self.send_error(404)
+            return
+        body = registry.prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+
+
+def start_http_server(port=9100, host='127.0.0.1', tries=16):
+    '''
+    Serve the metrics at ``http://host:port/metrics`` from a background
+    thread, once per process.  With ``bokeh serve --num-procs`` every
+    process gets its own endpoint, on the next free port of ``tries``.
+    '''
+    global _server
+    if _server is not None:
+        return _server.server_address[1]
+
+    for port in range(port, port + tries):
+        try:
+            _server = HTTPServer((host, port), MetricsHandler)
+        except OSError:
+            continue
+        thread = threading.Thread(target=_server.serve_forever, daemon=True)
+        thread.start()
+        log.info('serving metrics at http://%s:%d/metrics', host, port)
+        return port
+
+    log.warning('no free port for the metrics endpoint')
@@ -0,0 +1,63 @@
+'''
+Fast Gaussian probability density function.
+
+``scipy.stats.norm.pdf`` validates and broadcasts its arguments through the
+generic distribution machinery on every call.  ``gaussian_pdf`` computes
+the density directly, in place in a single output buffer, keeps ``float32``
+input in ``float32``, and evaluates many ``(mu, sigma)`` pairs against one
+``x`` grid in one call:
+
+    y = gaussian_pdf(x, 10, 4)                    # shape x.shape
+    y = gaussian_pdf(x, [10, 15, 8], [4, 1, 2])   # shape (3,) + x.shape
+    gaussian_pdf(x, mu, sigma, out=y)             # reuse a buffer
+
+'''
+
+import math
+
+import numpy as np
+
+INV_SQRT_2PI = 1 / math.sqrt(2 * math.pi)
+
+
+def gaussian_pdf(x, mu=0.0, sigma=1.0, out=None, dtype=None):
+    '''
+    Density of the normal distribution(s) ``N(mu, sigma**2)`` at ``x``.
+
+    ``mu`` and ``sigma`` are broadcast together, and the result has shape
+    ``broadcast(mu, sigma).shape + x.shape``.  It is written to ``out``
+    when given.  The computation is done in ``dtype``, which defaults to
+    the dtype of ``out``, or of ``x`` if it is a floating point array, or
+    ``float64``.  ``sigma`` must be positive.
+    '''
+    x = np.asarray(x)
+    if dtype is None:
+        if out is not None:
+            dtype = out.dtype
+        elif np.issubdtype(x.dtype, np.floating):
+            dtype = x.dtype
+        else:
+            dtype = np.float64
+
+    mu, sigma = np.broadcast_arrays(np.asarray(mu, dtype=dtype),
+                                    np.asarray(sigma, dtype=dtype))
+    shape = mu.shape + x.shape
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape:
+        raise ValueError('out has shape {}, expected {}'.format(out.shape,
+                                                                shape))
+
+    # align the parameters with the leading axes of the output
+    trailing = (1,) * x.ndim
+    mu = mu.reshape(mu.shape + trailing)
+    inv_sigma = (1 / sigma).reshape(sigma.shape + trailing)
+
+    # exp(-(x - mu)**2 / (2 sigma**2)) / (sqrt(2 pi) sigma), in place
+    np.subtract(x, mu, out=out)
+    out *= inv_sigma
+    np.square(out, out=out)
+    out *= -0.5
+    np.exp(out, out=out)
+    out *= inv_sigma * INV_SQRT_2PI
+    return out
@@ -0,0 +1,129 @@
+'''
+Level-of-detail point pyramid for zoomable scatter plots.
+
+A ``PointPyramid`` sorts the points into a fine square grid once and keeps,
+for every coarser level of the grid, a few randomly chosen points per
+cell.  A viewport query then only looks at the cells it covers: if they
+hold few enough points, those exact points are returned, otherwise the
+representative points of the finest level that stays under the limit.
+Either way the cost depends on what is visible, not on the dataset size.
+
+    pyramid = PointPyramid(x, y)
+    inds, exact = pyramid.query((x0, x1), (y0, y1), max_points=20000)
+
+``ScatterLOD`` keeps a circle glyph in a plot showing the query result for
+the current plot ranges.
+
+'''
+
+import numpy as np
+
+from bokeh.models import ColumnDataSource
+
+from callbacks import on_ranges_change
+from selection import GridIndex, gather_ranges
+from transport import compact_columns
+
+
+class PointPyramid(object):
+    '''
+    Grid pyramid over the points ``(x, y)``.
+
+    The finest grid has ``2**levels`` cells on a side; level ``l`` has
+    ``2**l``.  Each cell of each level keeps up to ``samples`` randomly
+    chosen points.
+    '''
+
+    def __init__(self, x, y, levels=9, samples=8, seed=0):
+        self.x = x
+        self.y = y
+        self.levels = levels
+        self.samples = samples
+
+        # the finest level is a grid index of all the points
+        self.grid = GridIndex(x, y, 2 ** levels)
+        col, row = self.grid.cell_of(x, y)
+
+        # per level, the sample points sorted by cell
+        shuffled = np.random.default_rng(seed).permutation(len(x))
+        col, row = col[shuffled], row[shuffled]
+        self.sample_inds = []
+        self.sample_offsets = []
+        for level in range(levels + 1):
+            shift = levels - level
+            cell = (row >> shift) * 2 ** level + (col >> shift)
+            by_cell = np.argsort(cell, kind='stable')  # random within a cell
+            counts = np.bincount(cell, minlength=4 ** level)
+            starts = np.cumsum(counts) - counts
+            rank = np.arange(len(cell)) - np.repeat(starts, counts)
+            keep = by_cell[rank < samples]
+            self.sample_inds.append(shuffled[keep])
+            kept = np.minimum(counts, samples)
+            self.sample_offsets.append(np.concatenate(([0], np.cumsum(kept))))
+
+    def _visible(self, x_range, y_range, level):
+        '''Start and stop offsets of the visible cells at ``level``.'''
+        (c0, c1), (r0, r1) = self.grid.cell_of(x_range, y_range)
+        shift = self.levels - level
+        c0, c1, r0, r1 = c0 >> shift, c1 >> shift, r0 >> shift, r1 >> shift
+        # each row of visible cells is one contiguous block
+        rows = np.arange(r0, r1 + 1) * 2 ** level
+        return rows + c0, rows + c1 + 1
+
+    def _in_view(self, inds, x_range, y_range):
+        x, y = self.x[inds], self.y[inds]
+        return inds[(x >= x_range[0]) & (x <= x_range[1]) &
+                    (y >= y_range[0]) & (y <= y_range[1])]
+
+    def query(self, x_range, y_range, max_points=20000):
+        '''
+        Indices of the points to draw in the viewport, and whether they are
+        all the points in it (``True``) or a representative sample.
+        '''
+        x_range, y_range = sorted(x_range), sorted(y_range)
+        first, last = self._visible(x_range, y_range, self.levels)
+        offsets = self.grid.offsets
+        if (offsets[last] - offsets[first]).sum() <= max_points:
+            inds = gather_ranges(self.grid.order, offsets[first],
+                                 offsets[last])
+            return self._in_view(inds, x_range, y_range), True
+
+        # the finest level whose samples stay under the limit
+        for level in range(self.levels, -1, -1):
+            first, last = self._visible(x_range, y_range, level)
+            offsets = self.sample_offsets[level]
+            if (offsets[last] - offsets[first]).sum() <= max_points:
+                break
+        inds = gather_ranges(self.sample_inds[level], offsets[first],
+                             offsets[last])
+        return self._in_view(inds, x_range, y_range), False
+
+
+class ScatterLOD(object):
+    '''
+    Circle glyph in ``plot`` showing at most ``max_points`` points of the
+    ``pyramid``, re-queried whenever the plot ranges change, and sent
+    as ``float32`` coordinates.  The plot ranges must have explicit
+    ``start`` and ``end`` values.
+    '''
+
+    def __init__(self, pyramid, plot, doc, max_points=20000, **glyph_args):
+        self.pyramid = pyramid
+        self.plot = plot
+        self.max_points = max_points
+        self.source = ColumnDataSource(data=self._data())
+        self.renderer = plot.circle('x', 'y', source=self.source,
+                                    **glyph_args)
+        on_ranges_change(plot, doc, self.update)
+
+    def _data(self):
+        x_range, y_range = self.plot.x_range, self.plot.y_range
+        inds, _ = self.pyramid.query((x_range.start, x_range.end),
+                                     (y_range.start, y_range.end),
+                                     self.max_points)
+        return compact_columns(dict(x=self.pyramid.x[inds],
+                                    y=self.pyramid.y[inds], index=inds))
+
+    def update(self):
+        '''Show the points for the current plot ranges.'''
+        self.source.data = self._data()
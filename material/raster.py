@@ -0,0 +1,103 @@
+'''
+Server-side rasterization of a scatter plot with Datashader.
+
+Instead of sending every point to the browser, a ``ScatterRaster`` shades
+the points into an image the size of the plot and shows it with an
+``image_rgba`` glyph.  The image is re-rendered whenever the plot ranges
+change, so zooming in reveals the detail of the underlying points.  The
+rendering runs off the server's event loop (see ``Offloaded`` in
+callbacks.py), and only the finished image is assigned on it.
+
+    raster = ScatterRaster(pd.DataFrame({'x': x, 'y': y}), plot, curdoc())
+
+'''
+
+import numpy as np
+
+import datashader as ds
+import datashader.transfer_functions as tf
+
+from callbacks import Offloaded, on_ranges_change
+
+
+class ScatterRaster(object):
+    '''
+    Shade the ``x`` and ``y`` columns of the ``points`` DataFrame into
+    ``plot``, whose ``x_range`` and ``y_range`` must have explicit
+    ``start`` and ``end`` values.  The DataFrame is not copied, so one
+    can be shared by many sessions.
+
+    ``cmap`` is used for all the points and ``selected_cmap`` for the
+    points at ``self.selected``, drawn on top of them.  ``update()``
+    re-renders the current view in the background.  With
+    ``npartitions``, all the points are aggregated in parallel, over that
+    many partitions of the DataFrame, on dask's thread pool.
+    '''
+
+    def __init__(self, points, plot, doc, cmap=('lightgray', 'black'),
+                 selected_cmap=('lightblue', 'darkblue'), how='log',
+                 npartitions=None):
+        self.data = points
+        if npartitions and npartitions > 1:
+            import dask.dataframe as dd
+            # the partitions are slices of the DataFrame, not copies
+            self.partitions = dd.from_pandas(points, npartitions=npartitions,
+                                             sort=False)
+        else:
+            self.partitions = points
+        self.plot = plot
+        self.doc = doc
+        self.cmap = list(cmap)
+        self.selected_cmap = list(selected_cmap)
+        self.how = how
+        self.selected = None
+
+        # a blank image until the first rendering is done
+        self.image = plot.image_rgba(
+            image=[np.zeros((1, 1), dtype=np.uint32)],
+            x=plot.x_range.start,
+            y=plot.y_range.start,
+            dw=plot.x_range.end - plot.x_range.start,
+            dh=plot.y_range.end - plot.y_range.start,
+        )
+
+        # rendered in a worker thread, with the view read beforehand
+        self.update = Offloaded(doc, self.render, self._show, self._view)
+        on_ranges_change(plot, doc, self.update)
+        self.update()
+
+    def _view(self):
+        # everything rendering needs from the models, read on the event loop
+        return ((self.plot.plot_width, self.plot.plot_height),
+                (self.plot.x_range.start, self.plot.x_range.end),
+                (self.plot.y_range.start, self.plot.y_range.end),
+                self.selected)
+
+    def render(self, shape, x_range, y_range, selected=None):
+        '''
+        Shade the points in the ranges to an RGBA image of ``shape``
+        (width, height) pixels, with the points at ``selected`` on top.
+        Returns the image and the ranges.
+        '''
+        canvas = ds.Canvas(plot_width=shape[0], plot_height=shape[1],
+                           x_range=x_range, y_range=y_range)
+        img = tf.shade(canvas.points(self.partitions, 'x', 'y'),
+                       cmap=self.cmap, how=self.how)
+
+        if selected is not None and len(selected):
+            points = self.data.iloc[selected]
+            img = tf.stack(img, tf.shade(canvas.points(points, 'x', 'y'),
+                                         cmap=self.selected_cmap,
+                                         how=self.how))
+
+        return np.asarray(img.data, dtype=np.uint32), x_range, y_range
+
+    def _show(self, rendered):
+        image, (x0, x1), (y0, y1) = rendered
+        self.image.data_source.data = dict(
+            image=[image], x=[x0], y=[y0], dw=[x1 - x0], dh=[y1 - y0])
+
+    def select(self, inds):
+        '''Highlight the points at ``inds`` (``None`` clears it).'''
+        self.selected = inds
+        self.update()
@@ -0,0 +1,221 @@
+'''
+Resolve box and lasso selections against point arrays on the server.
+
+These take the geometry of a ``SelectionGeometry`` event, in data
+coordinates, and return the indices of the points inside it, so that
+selection does not depend on the browser hit testing every glyph.
+
+    inds = select_geometry(x, y, event.geometry)
+
+For large datasets, a ``GridIndex`` built once over the points answers the
+same selections by only looking at the grid cells the geometry covers:
+points in cells entirely inside it are taken as they are, and only the
+points in cells on its boundary are tested exactly.
+
+    index = GridIndex(x, y)
+    inds = index.select(event.geometry)
+
+'''
+
+import numpy as np
+
+
+def points_in_box(x, y, x0, x1, y0, y1):
+    '''Indices of the points inside the box, edges included.'''
+    x0, x1 = sorted((x0, x1))
+    y0, y1 = sorted((y0, y1))
+    return np.flatnonzero((x >= x0) & (x <= x1) & (y >= y0) & (y <= y1))
+
+
+def inside_polygon(x, y, px, py):
+    '''
+    Boolean mask of the points inside the polygon with vertices
+    ``(px, py)``, by the even-odd rule.
+    '''
+    inside = np.zeros(len(x), dtype=bool)
+    px_prev, py_prev = px[-1], py[-1]
+    for px_i, py_i in zip(px, py):
+        # does a ray from each point in the +x direction cross this edge?
+        crosses = (py_i > y) != (py_prev > y)
+        if crosses.any():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cross = (px_prev - px_i) * (y - py_i) / (py_prev - py_i) + px_i
+            inside ^= crosses & (x < x_cross)
+        px_prev, py_prev = px_i, py_i
+    return inside
+
+
+def points_in_polygon(x, y, px, py):
+    '''Indices of the points inside the polygon with vertices (px, py).'''
+    px = np.asarray(px, dtype=float)
+    py = np.asarray(py, dtype=float)
+
+    # only points in the bounding box of the polygon need the exact test
+    candidates = points_in_box(x, y, px.min(), px.max(), py.min(), py.max())
+    inside = inside_polygon(x[candidates], y[candidates], px, py)
+    return candidates[inside]
+
+
+def select_geometry(x, y, geometry):
+    '''
+    Indices of the points selected by a box ("rect") or lasso ("poly")
+    selection geometry.
+    '''
+    if geometry['type'] == 'rect':
+        return points_in_box(x, y, geometry['x0'], geometry['x1'],
+                             geometry['y0'], geometry['y1'])
+    elif geometry['type'] == 'poly':
+        return points_in_polygon(x, y, geometry['x'], geometry['y'])
+    else:
+        raise ValueError('unsupported selection: {}'.format(geometry['type']))
+
+
+# ~~~~~~~~~~~~~~ grid index ~~~~~~~~~~~~~~ #
+def gather_ranges(values, starts, stops):
+    '''Concatenate ``values[start:stop]`` for each start/stop pair.'''
+    lengths = stops - starts
+    total = lengths.sum()
+    if total == 0:
+        return values[:0]
+    ends = np.cumsum(lengths)
+    inds = np.arange(total) - np.repeat(ends - lengths - starts, lengths)
+    return values[inds]
+
+
+class GridIndex(object):
+    '''
+    Uniform grid of ``size`` by ``size`` cells over the points ``(x, y)``.
+
+    ``order`` holds the point indices sorted by cell (row-major) and the
+    points of cell ``i`` are ``order[offsets[i]:offsets[i + 1]]``.  An
+    ``order`` computed before for the same points and ``size`` can be
+    given, e.g. read back from a cache (see ``cached_grid_index``).
+    '''
+
+    def __init__(self, x, y, size=256, order=None):
+        self.x = x
+        self.y = y
+        self.size = size
+        self.x_min, self.x_max = float(np.min(x)), float(np.max(x))
+        self.y_min, self.y_max = float(np.min(y)), float(np.max(y))
+        tiny = np.finfo(float).tiny
+        self.dx = max(self.x_max - self.x_min, tiny) / size
+        self.dy = max(self.y_max - self.y_min, tiny) / size
+
+        col, row = self.cell_of(x, y)
+        cell = row * size + col
+        if order is None:
+            order = np.argsort(cell, kind='stable')
+            if len(order) <= np.iinfo(np.int32).max:
+                order = order.astype(np.int32)  # half the memory of int64
+        self.order = order
+        counts = np.bincount(cell, minlength=size ** 2)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def cell_of(self, x, y):
+        '''Column and row of the cells holding the points (x, y).'''
+        col = ((np.asarray(x) - self.x_min) / self.dx).astype(np.int64)
+        row = ((np.asarray(y) - self.y_min) / self.dy).astype(np.int64)
+        return (np.clip(col, 0, self.size - 1),
+                np.clip(row, 0, self.size - 1))
+
+    def points_in_cells(self, cells):
+        '''Indices of the points in the (row-major) ``cells``.'''
+        return gather_ranges(self.order, self.offsets[cells],
+                             self.offsets[cells + 1])
+
+    def _cell_block(self, x0, x1, y0, y1):
+        # rows and columns of the cells overlapping the box, or None
+        if x1 < self.x_min or x0 > self.x_max or \
+                y1 < self.y_min or y0 > self.y_max:
+            return None
+        (c0, c1), (r0, r1) = self.cell_of([x0, x1], [y0, y1])
+        return np.arange(c0, c1 + 1), np.arange(r0, r1 + 1)
+
+    def _test(self, cells, inside):
+        # exact test of the points in the given cells
+        inds = self.points_in_cells(cells)
+        return inds[inside(self.x[inds], self.y[inds])]
+
+    def select_box(self, x0, x1, y0, y1):
+        '''Indices of the points inside the box, edges included.'''
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        block = self._cell_block(x0, x1, y0, y1)
+        if block is None:
+            return np.array([], dtype=np.intp)
+        cols, rows = block
+
+        # the outer ring of the block is tested, the cells inside it are not
+        cells = rows[:, None] * self.size + cols
+        ring = np.ones(cells.shape, dtype=bool)
+        ring[1:-1, 1:-1] = False
+
+        inside = self.points_in_cells(cells[~ring])
+        boundary = self._test(cells[ring], lambda x, y: (
+            (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)))
+        return np.sort(np.concatenate((inside, boundary)))
+
+    def select_polygon(self, px, py):
+        '''Indices of the points inside the polygon with vertices (px, py).'''
+        px = np.asarray(px, dtype=float)
+        py = np.asarray(py, dtype=float)
+        block = self._cell_block(px.min(), px.max(), py.min(), py.max())
+        if block is None:
+            return np.array([], dtype=np.intp)
+        cols, rows = block
+
+        # mark the cells the polygon edges pass through, sampling each edge
+        # at half a cell and adding the neighbors of every sampled cell
+        edge = np.zeros((len(rows) + 2, len(cols) + 2), dtype=bool)
+        step = min(self.dx, self.dy) / 2
+        x_prev, y_prev = px[-1], py[-1]
+        for x_i, y_i in zip(px, py):
+            n = int(np.hypot(x_i - x_prev, y_i - y_prev) / step) + 2
+            t = np.linspace(0, 1, n)
+            col, row = self.cell_of(x_prev + t * (x_i - x_prev),
+                                    y_prev + t * (y_i - y_prev))
+            edge[row - rows[0] + 1, col - cols[0] + 1] = True
+            x_prev, y_prev = x_i, y_i
+        boundary = np.zeros((len(rows), len(cols)), dtype=bool)
+        for i in range(3):
+            for j in range(3):
+                boundary |= edge[i:i + len(rows), j:j + len(cols)]
+
+        # the other cells are entirely inside or outside, like their centers
+        cells = rows[:, None] * self.size + cols
+        centers_x = self.x_min + (cols + 0.5) * self.dx
+        centers_y = self.y_min + (rows + 0.5) * self.dy
+        centers_x, centers_y = np.broadcast_arrays(centers_x, centers_y[:, None])
+        interior = ~boundary & inside_polygon(
+            centers_x.ravel(), centers_y.ravel(), px, py).reshape(cells.shape)
+
+        inside = self.points_in_cells(cells[interior])
+        boundary = self._test(cells[boundary],
+                              lambda x, y: inside_polygon(x, y, px, py))
+        return np.sort(np.concatenate((inside, boundary)))
+
+    def select(self, geometry):
+        '''Like ``select_geometry``, using the index.'''
+        if geometry['type'] == 'rect':
+            return self.select_box(geometry['x0'], geometry['x1'],
+                                   geometry['y0'], geometry['y1'])
+        elif geometry['type'] == 'poly':
+            return self.select_polygon(geometry['x'], geometry['y'])
+        else:
+            raise ValueError('unsupported selection: {}'.format(
+                geometry['type']))
+
+
+def cached_grid_index(x, y, params, cache, size=256):
+    '''
+    ``GridIndex`` of the points ``(x, y)`` whose ``order`` is kept in
+    ``cache`` (see dataset_cache.py) under ``params``, which must identify
+    the points, and memory-mapped, so server processes share one copy.
+    '''
+    def build(filename):
+        np.save(filename, GridIndex(x, y, size).order)
+
+    order = cache.array(dict(params, kind='grid_index_order', size=size),
+                        build)
+    return GridIndex(x, y, size, order=order)
@@ -0,0 +1,43 @@
+'''
+Read-only data shared by every session of a Bokeh server.
+
+``bokeh serve`` runs the app script again for each new session, but
+imported modules are only imported once per process.  Data built through
+this module is therefore built once and reused by every session.
+
+``shared`` keeps any object in memory for the life of the process.  To
+also share arrays between the worker processes of ``bokeh serve
+--num-procs``, build them from a memory-mapped ``DatasetCache`` (see
+dataset_cache.py).
+
+    index = shared('gaussian-1-0-index', lambda: GridIndex(x, y))
+
+'''
+
+import threading
+
+import numpy as np
+
+_cache = {}
+_lock = threading.RLock()
+
+
+def _read_only(value):
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    return value
+
+
+def shared(key, build):
+    '''
+    Return ``build()``, calling it only the first time ``key`` is asked
+    for in this process.  Arrays in the result must not be modified.
+    '''
+    with _lock:
+        if key not in _cache:
+            value = build()
+            if isinstance(value, dict):
+                for item in value.values():
+                    _read_only(item)
+            _cache[key] = _read_only(value)
+        return _cache[key]
@@ -0,0 +1,47 @@
+'''
+Start Bokeh server sessions from a snapshot of their initial document.
+
+``bokeh serve`` runs the app script again for every new session, so a
+layout of several figures, glyphs and widgets is built from scratch each
+time, through the plotting API and any computation its initial state
+needs.  ``stamp`` builds it once per process, keeps the serialized
+document, and gives each new session a fresh copy by loading that instead:
+
+    def build(doc):
+        doc.add_root(column(figure(name='scatter'), Slider(name='low')))
+
+    stamp(curdoc(), 'app', build)
+    low = curdoc().select_one({'name': 'low'})
+
+Models are found again by ``name``, and callbacks are attached to the
+session's copies as usual.  Anything per session, or that cannot be
+serialized (callbacks, periodic callbacks), must be added after stamping.
+
+'''
+
+from bokeh.document import Document
+
+from shared_data import shared
+
+
+def snapshot(build):
+    '''The JSON of a new document populated by ``build(doc)``.'''
+    doc = Document()
+    build(doc)
+    return doc.to_json_string()
+
+
+def stamp(doc, key, build):
+    '''
+    Add to ``doc`` a copy of the roots and title of the document made by
+    ``build``, which is only called the first time ``key`` is stamped in
+    this process.
+    '''
+    template = Document.from_json_string(shared(key, lambda: snapshot(build)))
+    roots = list(template.roots)
+    # the models can only belong to one document at a time
+    template.clear()
+    for root in roots:
+        doc.add_root(root)
+    doc.title = template.title
+    return doc
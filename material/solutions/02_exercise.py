@@ -1,3 +1,9 @@
+import bokeh.layouts
+from bokeh.models.widgets import DataTable, TableColumn
+
+from stream_stats import StreamStats
+from streaming import BatchedStreamer
+
 mu_x1, mu_y1, mu_x2, mu_y2 = np.random.randint(-40, 40, 4)
 sigma_x1, sigma_y1, sigma_x2, sigma_y2 = np.random.randint(1, 25, 4)
 
@@ -28,22 +34,74 @@ circle2 = my_fig.circle(
     alpha=0.2,
 )
 
-handle = bokeh.io.show(my_fig, notebook_handle=True)
+# running estimates of both distributions, updated with every batch
+edges = np.linspace(-100, 100, 41)
+stats1 = StreamStats(['x', 'y'], edges)
+stats2 = StreamStats(['x', 'y'], edges)
+
+hist_fig = bokeh.plotting.figure(
+    plot_width=400,
+    plot_height=200,
+    x_axis_label='x',
+    x_range=my_fig.x_range,
+)
+for stats, color in ((stats1, palette[0]), (stats2, palette[1])):
+    hist_fig.quad(
+        left='left', right='right', top='count', bottom=0,
+        source=stats.histograms['x'],
+        color=color,
+        alpha=0.4,
+        line_color=None,
+    )
+
+tables = [
+    DataTable(
+        source=stats.summary,
+        columns=[TableColumn(field=field, title=field)
+                 for field in ('column', 'n', 'mean', 'std')],
+        width=400,
+        height=80,
+    )
+    for stats in (stats1, stats2)
+]
+
+handle = bokeh.io.show(
+    bokeh.layouts.column(my_fig, hist_fig, *tables),
+    notebook_handle=True,
+)
 
-new_data1=dict(x=[], y=[])
-new_data2=dict(x=[], y=[])
+# both sources are flushed together, with a single push_notebook, and the
+# points are sent as float32
+streamer = BatchedStreamer(
+    batch_size=5000,
+    interval=0.05,
+    rollover=20000,
+    handle=handle,
+    compact=True,
+)
+streamer.on_stream(data1, stats1.update)
+streamer.on_stream(data2, stats2.update)
 
 step = 0
 max_step = 1000  # arbitrary stop point for example
+n_new = 20  # points generated each step
 
 while step < max_step:
-    new_data1['x'] = [np.random.normal(loc=mu_x1, scale=sigma_x1)]
-    new_data1['y'] = [np.random.normal(loc=mu_y1, scale=sigma_y1)]
-    new_data2['x'] = [np.random.normal(loc=mu_x2, scale=sigma_x2)]
-    new_data2['y'] = [np.random.normal(loc=mu_y2, scale=sigma_y2)]
+    streamer.add(
+        data1,
+        x=np.random.normal(loc=mu_x1, scale=sigma_x1, size=n_new),
+        y=np.random.normal(loc=mu_y1, scale=sigma_y1, size=n_new),
+    )
+    streamer.add(
+        data2,
+        x=np.random.normal(loc=mu_x2, scale=sigma_x2, size=n_new),
+        y=np.random.normal(loc=mu_y2, scale=sigma_y2, size=n_new),
+    )
+    step += 1
 
-    data1.stream(new_data1)
-    data2.stream(new_data2)
+streamer.flush()
 
-    bokeh.io.push_notebook(handle=handle)
-    step += 1
+for name, stats, mu_x, sigma_x in (('data1', stats1, mu_x1, sigma_x1),
+                                   ('data2', stats2, mu_x2, sigma_x2)):
+    print('{}: mu_x {} (estimated {:.1f}), sigma_x {} (estimated {:.1f})'.format(
+        name, mu_x, stats.stats['x'].mean, sigma_x, stats.stats['x'].std))
@@ -12,13 +12,15 @@ mu = np.array([
 
 sigma = np.array([0.01, 0.1, 0.5, 1.0, 3.0, 2.0, 0.25, 5.0, 0.05])
 
-points = gaussian_points(mu, sigma, 1000000)
+points = cached_gaussian_points(mu, sigma, 1000000, dtype=np.float32, seed=0)
 
+# aggregated in parallel, one partition per core
+kdims = [
+    'independent variable',
+    'dependent variable'
+]
 hv_points = hv.Points(
-    points, label='Points',
-    kdims=[
-        'independent variable',
-        'dependent variable'
-    ])
+    gaussian_frame(points, kdims), label='Points',
+    kdims=kdims)
 
 datashade(hv_points)
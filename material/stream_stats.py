@@ -0,0 +1,162 @@
+'''
+Running statistics of streamed data, updated one batch at a time.
+
+Estimating the mean of a streamed column from its ``ColumnDataSource``
+means rescanning every point on every update, and the source only holds the
+points that have not been rolled over.  Instead, each batch is folded into
+running totals as it is streamed, in O(batch):
+
+  - ``RunningStats`` keeps the count, mean and variance (Welford's method,
+    merging a whole batch at once)
+  - ``RunningHistogram`` keeps the counts in fixed bins
+
+Both can forget old points gradually: with ``halflife``, a point's weight
+halves with every ``halflife`` newer points.
+
+``StreamStats`` attaches them to the columns streamed to a source through a
+``BatchedStreamer``, and publishes the results in small sources of their
+own, for a table and histograms next to the streamed plot:
+
+    stats = StreamStats(['x', 'y'], edges=np.linspace(-100, 100, 41))
+    streamer.on_stream(data1, stats.update)
+    fig.quad(left='left', right='right', top='count', bottom=0,
+             source=stats.histograms['x'])
+
+'''
+
+import numpy as np
+
+from bokeh.models import ColumnDataSource
+
+from histograms import bin_index
+
+
+def _weights(n, halflife):
+    # weight of each point of a batch, the newest last, relative to a point
+    # just after it; None when all points weigh the same
+    if halflife is None:
+        return None
+    return 0.5 ** (np.arange(n, 0, -1) / halflife)
+
+
+class RunningStats(object):
+    '''
+    Weighted count, mean and (population) variance of all the values given
+    to ``update``.
+    '''
+
+    def __init__(self, halflife=None):
+        self.halflife = halflife
+        self.weight = 0.0
+        self.mean = np.nan
+        self._m2 = 0.0  # weighted sum of squared differences from the mean
+
+    @property
+    def variance(self):
+        return self._m2 / self.weight if self.weight else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    def update(self, values):
+        '''Add a batch of ``values``.'''
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+
+        weights = _weights(len(values), self.halflife)
+        if weights is None:
+            batch_weight = float(len(values))
+            batch_mean = values.mean()
+            batch_m2 = np.square(values - batch_mean).sum()
+        else:
+            # the older points fade by the length of the batch
+            fade = 0.5 ** (len(values) / self.halflife)
+            self.weight *= fade
+            self._m2 *= fade
+            batch_weight = weights.sum()
+            batch_mean = np.dot(weights, values) / batch_weight
+            batch_m2 = np.dot(weights, np.square(values - batch_mean))
+
+        # merge the batch into the totals (Chan et al.)
+        if self.weight == 0:
+            self.weight, self.mean, self._m2 = batch_weight, batch_mean, batch_m2
+            return
+        total = self.weight + batch_weight
+        delta = batch_mean - self.mean
+        self.mean += delta * batch_weight / total
+        self._m2 += batch_m2 + delta ** 2 * self.weight * batch_weight / total
+        self.weight = total
+
+
+class RunningHistogram(object):
+    '''Weighted counts of the values given to ``update``, in fixed ``edges``.'''
+
+    def __init__(self, edges, halflife=None):
+        self.edges = np.asarray(edges, dtype=float)
+        self.halflife = halflife
+        self.counts = np.zeros(len(self.edges) - 1)
+
+    def update(self, values):
+        '''Add a batch of ``values``; those outside the edges are ignored.'''
+        if len(values) == 0:
+            return
+        n_bins = len(self.counts)
+        bins = bin_index(values, self.edges)
+        weights = _weights(len(bins), self.halflife)
+        if weights is not None:
+            self.counts *= 0.5 ** (len(bins) / self.halflife)
+        self.counts += np.bincount(bins, weights=weights,
+                                   minlength=n_bins + 1)[:n_bins]
+
+
+class StreamStats(object):
+    '''
+    Running statistics and histograms of the ``columns`` of streamed data.
+
+    ``update`` takes the data of one stream, e.g. as a ``BatchedStreamer``
+    listener, and refreshes ``summary``, a source with one row (column,
+    n, mean, std) per column, and ``histograms[column]``, sources with
+    ``left``, ``right`` and ``count`` columns over ``edges`` (one array for
+    all the columns, or a dict of arrays by column).
+    '''
+
+    def __init__(self, columns, edges, halflife=None):
+        self.columns = list(columns)
+        if not isinstance(edges, dict):
+            edges = {column: edges for column in self.columns}
+
+        self.stats = {column: RunningStats(halflife)
+                      for column in self.columns}
+        self.counts = {column: RunningHistogram(edges[column], halflife)
+                       for column in self.columns}
+
+        self.summary = ColumnDataSource(data=self._summary())
+        self.histograms = {
+            column: ColumnDataSource(data=dict(
+                left=hist.edges[:-1], right=hist.edges[1:],
+                count=hist.counts.copy()))
+            for column, hist in self.counts.items()
+        }
+
+    def _summary(self):
+        stats = [self.stats[column] for column in self.columns]
+        # arrays rather than lists, so the NaN of no data is sent as is
+        return dict(
+            column=self.columns,
+            n=np.array([s.weight for s in stats]),
+            mean=np.array([s.mean for s in stats]),
+            std=np.array([s.std for s in stats]),
+        )
+
+    def update(self, data):
+        '''Add the batch ``data``, a dict of column arrays.'''
+        for column in self.columns:
+            if column in data:
+                self.stats[column].update(data[column])
+                self.counts[column].update(data[column])
+
+        self.summary.data = self._summary()
+        for column, hist in self.counts.items():
+            self.histograms[column].data['count'] = hist.counts.copy()
@@ -0,0 +1,254 @@
+'''
+Batched streaming to ``ColumnDataSource`` objects.
+
+Streaming one point at a time means one message, and in a notebook one
+``push_notebook`` round trip, per point.  A ``BatchedStreamer`` buffers the
+points added to any number of sources and sends them together, as one
+array per column, once enough points are waiting or enough time has passed.
+
+    streamer = BatchedStreamer(batch_size=500, interval=0.05, handle=handle)
+    while step < max_step:
+        streamer.add(data1, x=x_batch, y=y_batch)
+    streamer.flush()
+
+In a Bokeh server app, a ``StreamHub`` runs one producer per process that
+reads batches from an async source and hands each batch to every session
+watching, instead of each session generating its own data:
+
+    hub = shared('gaussian-stream', lambda: StreamHub(make_feed))
+    hub.watch(curdoc(), {0: data1, 1: data2}, rollover=20000)
+
+'''
+
+import asyncio
+from collections import deque
+import logging
+import time
+
+import numpy as np
+
+import bokeh.io
+from bokeh.models import CustomJS, Range1d
+
+from transport import compact_columns
+
+log = logging.getLogger(__name__)
+
+
+class BatchedStreamer(object):
+    '''
+    Buffer points for one or more ``ColumnDataSource`` objects.
+
+    The buffer is flushed when ``batch_size`` points are waiting or when
+    ``interval`` seconds have passed since the last flush; either can be
+    ``None`` to only flush explicitly.  ``rollover`` is passed to
+    ``ColumnDataSource.stream`` to cap the length of each source, and
+    points that would be rolled over at once are not sent.  With
+    ``compact``, the columns are sent as ``float32`` or 32-bit integers
+    (see transport.py).  If a notebook ``handle`` is given, every flush
+    ends with a single ``push_notebook`` for all the sources.
+    '''
+
+    def __init__(self, batch_size=1000, interval=0.1, rollover=None,
+                 handle=None, compact=False):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.rollover = rollover
+        self.handle = handle
+        self.compact = compact
+
+        self._pending = {}  # source -> {column: [arrays]}
+        self._listeners = {}  # source -> [callbacks]
+        self._n_pending = 0
+        self._last_flush = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def on_stream(self, source, callback):
+        '''
+        Call ``callback(data)`` with the dict of column arrays streamed to
+        ``source`` by every flush, including any points that ``rollover``
+        keeps from being sent.
+        '''
+        self._listeners.setdefault(source, []).append(callback)
+
+    def add(self, source, **columns):
+        '''
+        Queue new values for ``source``, given as column=value(s) keyword
+        arguments, and flush if a threshold has been reached.
+        '''
+        pending = self._pending.setdefault(source, {})
+        n_new = 0
+        for name, values in columns.items():
+            values = np.atleast_1d(values)
+            pending.setdefault(name, []).append(values)
+            n_new = max(n_new, len(values))
+        self._n_pending += n_new
+
+        if ((self.batch_size is not None and
+                self._n_pending >= self.batch_size) or
+                (self.interval is not None and
+                 time.time() - self._last_flush >= self.interval)):
+            self.flush()
+
+    def flush(self):
+        '''Stream everything waiting in the buffer.'''
+        if self._n_pending:
+            for source, pending in self._pending.items():
+                data = {name: np.concatenate(values)
+                        for name, values in pending.items()}
+                for callback in self._listeners.get(source, ()):
+                    callback(data)
+                if self.rollover:
+                    # the older points would be rolled over right away
+                    data = {name: values[-self.rollover:]
+                            for name, values in data.items()}
+                if self.compact:
+                    data = compact_columns(data)
+                source.stream(data, rollover=self.rollover)
+
+            if self.handle is not None:
+                bokeh.io.push_notebook(handle=self.handle)
+
+        self._pending = {}
+        self._n_pending = 0
+        self._last_flush = time.time()
+
+
+# ~~~~~~~~~~~~~~ server streams ~~~~~~~~~~~~~~ #
+async def gaussian_feed(mu, sigma, n_new=20, interval=0.05, seed=None):
+    '''
+    Async source of random points: every ``interval`` seconds, yield
+    ``{i: {'x': x, 'y': y}}`` with ``n_new`` new points for each Gaussian
+    distribution ``i``, centered at ``mu[i]`` with spread ``sigma[i]``
+    (one value or an (x, y) pair).
+    '''
+    rng = np.random.default_rng(seed)
+    mu = np.asarray(mu, dtype=float)
+    sigma = np.asarray(sigma, dtype=float).reshape(len(mu), -1)
+    while True:
+        # all the distributions in one draw
+        points = rng.normal(mu[:, None], sigma[:, None],
+                            size=(len(mu), n_new, 2))
+        yield {i: dict(x=p[:, 0], y=p[:, 1]) for i, p in enumerate(points)}
+        await asyncio.sleep(interval)
+
+
+class SessionStream(object):
+    '''
+    Stream the batches of a ``StreamHub`` to the ``sources`` of one
+    session, a dict mapping the names used in the batches to
+    ``ColumnDataSource`` objects of ``doc``.
+
+    Batches are applied on the next tick of ``doc``, and batches arriving
+    until then are merged into the same update, with one ``stream`` per
+    source.  Each update is followed by a counter change that the browser
+    echoes back once it has received and applied it (see ``ack``), and a
+    new update is only sent once the previous one is acknowledged, so a
+    client on a slow connection gets fewer, larger updates instead of a
+    growing queue of websocket writes.  At most ``max_batches`` wait for
+    the client; older ones are dropped and counted in ``dropped``.
+    ``rollover`` and ``compact`` are passed to the ``BatchedStreamer``.
+    '''
+
+    def __init__(self, doc, sources, rollover=None, max_batches=50,
+                 compact=False):
+        self.doc = doc
+        self.sources = sources
+        self.streamer = BatchedStreamer(batch_size=None, interval=None,
+                                        rollover=rollover, compact=compact)
+        self.dropped = 0
+        self._batches = deque(maxlen=max_batches)
+        self._scheduled = False
+
+        # the server counts the updates sent in ack.start, and the browser
+        # copies it to ack.end after applying everything sent before it
+        self.ack = Range1d(start=0, end=0)
+        self.ack.js_on_change('start', CustomJS(code='cb_obj.end = cb_obj.start'))
+        self.ack.on_change('end', self._acknowledged)
+        doc.add_root(self.ack)
+
+    @property
+    def waiting(self):
+        '''Whether an update has not been acknowledged by the browser yet.'''
+        return self.ack.end < self.ack.start
+
+    def push(self, batch):
+        '''Queue ``batch`` for the next tick of the session.'''
+        if len(self._batches) == self._batches.maxlen:
+            self.dropped += 1
+        self._batches.append(batch)
+        if not self._scheduled:
+            self._scheduled = True
+            self.doc.add_next_tick_callback(self._apply)
+
+    def _apply(self):
+        self._scheduled = False
+        if self.waiting or not self._batches:
+            return
+        while self._batches:
+            for name, columns in self._batches.popleft().items():
+                self.streamer.add(self.sources[name], **columns)
+        self.streamer.flush()
+        self.ack.start += 1
+
+    def _acknowledged(self, attr, old, new):
+        # the batches that arrived meanwhile go out as one update
+        if self._batches and not self._scheduled:
+            self._scheduled = True
+            self.doc.add_next_tick_callback(self._apply)
+
+
+class StreamHub(object):
+    '''
+    One producer fanning the batches of an async source out to sessions.
+
+    ``feed()`` must return an async iterator of batches, each a dict
+    mapping source names to dicts of column arrays.  The producer runs as
+    an asyncio task on the server's event loop.  It starts with the first
+    session watching and stops when the last one is destroyed, so nothing
+    is produced while nobody watches.
+    '''
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.sessions = set()
+        self._task = None
+
+    def watch(self, doc, sources, rollover=None, max_batches=50,
+              compact=False):
+        '''
+        Stream the batches to ``sources`` in ``doc`` (see
+        ``SessionStream``) until the session is destroyed.
+        '''
+        stream = SessionStream(doc, sources, rollover, max_batches, compact)
+        self.sessions.add(stream)
+        doc.on_session_destroyed(
+            lambda session_context: self._leave(stream))
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._produce())
+        return stream
+
+    def _leave(self, stream):
+        self.sessions.discard(stream)
+        if not self.sessions and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _produce(self):
+        task = asyncio.current_task()
+        try:
+            async for batch in self.feed():
+                for stream in list(self.sessions):
+                    stream.push(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception('stream source failed')
+        finally:
+            if self._task is task:
+                self._task = None
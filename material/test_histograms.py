@@ -0,0 +1,84 @@
+'''
+Check the histogram helpers against ``np.histogram``.
+
+    python -m pytest test_histograms.py
+
+'''
+
+import numpy as np
+import pytest
+
+from histograms import CumulativeHistogram, SelectionHistogram
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    return np.concatenate((rng.normal(500, 100, 40000),
+                           rng.normal(250, 50, 80000),
+                           rng.normal(550, 10, 20000)))
+
+
+def test_selection_histogram_counts(data):
+    hist = SelectionHistogram(data, bins=100)
+    inds = np.random.default_rng(1).choice(len(data), 5000, replace=False)
+    selected, unselected = hist.counts(inds)
+
+    mask = np.zeros(len(data), dtype=bool)
+    mask[inds] = True
+    np.testing.assert_array_equal(selected,
+                                  np.histogram(data[mask], hist.edges)[0])
+    np.testing.assert_array_equal(unselected,
+                                  np.histogram(data[~mask], hist.edges)[0])
+
+
+@pytest.mark.parametrize('fine_bins', [4000, 4096])
+@pytest.mark.parametrize('n_bins', [10, 100])
+def test_layout_bins_are_equal_and_cover_the_range(data, fine_bins, n_bins):
+    hist = CumulativeHistogram(data, bins=fine_bins)
+    rng = np.random.default_rng(2)
+    lows = rng.uniform(data.min(), data.max(), 200)
+    spans = (data.max() - data.min()) * rng.uniform(0, 1, 200) ** 3
+    for low, high in zip(lows, lows + spans):
+        layout = hist.layout(low, high, n_bins)
+        widths = np.diff(layout)
+        assert 1 <= len(widths) <= n_bins
+        assert len(set(widths)) == 1
+        assert layout[0] >= 0 and layout[-1] <= fine_bins
+
+        # unless the fine bins are a multiple of the shown ones, ranges
+        # near the full width can miss part of a bin at the edges
+        slack = 0.0
+        if fine_bins % n_bins:
+            slack = (widths[0] - 1) * (hist.edges[1] - hist.edges[0]) * 1.001
+        edges = hist.edges[layout]
+        assert edges[0] <= max(low, hist.edges[0]) + slack
+        assert edges[-1] >= min(high, hist.edges[-1]) - slack
+
+
+def test_layout_full_range_of_a_multiple(data):
+    hist = CumulativeHistogram(data, bins=4000)
+    layout = hist.layout(data.min(), data.max(), 100)
+    np.testing.assert_array_equal(layout, np.arange(0, 4001, 40))
+
+
+def test_layout_fewer_fine_bins_than_shown(data):
+    hist = CumulativeHistogram(data, bins=4000)
+    low, high = hist.edges[1000], hist.edges[1030]
+    np.testing.assert_array_equal(hist.layout(low, high, 100),
+                                  np.arange(1000, 1031))
+
+
+def test_rebin_matches_np_histogram(data):
+    hist = CumulativeHistogram(data, bins=4000)
+    inds = np.random.default_rng(3).choice(len(data), 10000, replace=False)
+    selection = hist.selected_cumulative(inds)
+
+    for low, high in [(data.min(), data.max()), (200, 300), (540, 541.5),
+                      (-1e6, 1e6)]:
+        layout = hist.layout(low, high, 100)
+        edges = hist.edges[layout]
+        np.testing.assert_array_equal(hist.rebin(hist.cumulative, layout),
+                                      np.histogram(data, edges)[0])
+        np.testing.assert_array_equal(hist.rebin(selection, layout),
+                                      np.histogram(data[inds], edges)[0])
@@ -0,0 +1,70 @@
+'''
+Check the grid index against the brute-force selections.
+
+    python -m pytest test_selection.py
+
+'''
+
+import numpy as np
+import pytest
+
+from dataset_cache import DatasetCache
+from selection import GridIndex, cached_grid_index, select_geometry
+
+
+@pytest.fixture(scope='module')
+def points():
+    rng = np.random.default_rng(0)
+    return np.concatenate((rng.normal((500, 100), (100, 10), (20000, 2)),
+                           rng.normal((250, 50), (50, 10), (40000, 2)),
+                           rng.normal((550, 40), (10, 10), (10000, 2))))
+
+
+def boxes(rng, n):
+    for _ in range(n):
+        x0, x1 = rng.uniform(0, 900, 2)
+        y0, y1 = rng.uniform(0, 150, 2)
+        yield dict(type='rect', x0=x0, x1=x1, y0=y0, y1=y1)
+
+
+def polygons(rng, n):
+    for _ in range(n):
+        # a random star-shaped lasso around a random center
+        n_vertices = int(rng.integers(3, 30))
+        angles = np.sort(rng.uniform(0, 2 * np.pi, n_vertices))
+        radius = rng.uniform(0.1, 1, n_vertices)
+        cx, cy = rng.uniform(100, 700), rng.uniform(20, 130)
+        yield dict(type='poly',
+                   x=(cx + 300 * radius * np.cos(angles)).tolist(),
+                   y=(cy + 50 * radius * np.sin(angles)).tolist())
+
+
+@pytest.mark.parametrize('size', [16, 256])
+def test_grid_index_matches_brute_force(points, size):
+    x, y = points[:, 0], points[:, 1]
+    index = GridIndex(x, y, size)
+    rng = np.random.default_rng(size)
+    for geometry in list(boxes(rng, 50)) + list(polygons(rng, 50)):
+        np.testing.assert_array_equal(index.select(geometry),
+                                      select_geometry(x, y, geometry))
+
+
+def test_grid_index_outside_the_points(points):
+    x, y = points[:, 0], points[:, 1]
+    index = GridIndex(x, y)
+    geometry = dict(type='rect', x0=-1e4, x1=-1e3, y0=-1e4, y1=-1e3)
+    assert len(index.select(geometry)) == 0
+
+
+def test_cached_grid_index(points, tmp_path):
+    x, y = points[:, 0], points[:, 1]
+    cache = DatasetCache(str(tmp_path))
+    params = dict(points='test')
+    first = cached_grid_index(x, y, params, cache)
+    again = cached_grid_index(x, y, params, cache)
+
+    assert isinstance(again.order, np.memmap)
+    np.testing.assert_array_equal(again.order, GridIndex(x, y).order)
+    geometry = next(boxes(np.random.default_rng(0), 1))
+    np.testing.assert_array_equal(first.select(geometry),
+                                  select_geometry(x, y, geometry))